@@ -0,0 +1,188 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app.metrics import Counter, Gauge, Histogram
+from app.replicas import READ_METHODS, client_key
+
+load_dotenv()
+
+# Ограничение числа одновременно обрабатываемых запросов по классам маршрутов (в каждом воркере).
+# Сверх лимита запрос ждёт в очереди не дольше ADMISSION_QUEUE_TIMEOUT секунд; при полной очереди
+# или истечении срока сразу получает 503 с Retry-After. Лимит 0 отключает ограничение класса
+ADMISSION_LIMITS = {
+    "heavy": int(os.getenv("ADMISSION_HEAVY_LIMIT", "4")),
+    "write": int(os.getenv("ADMISSION_WRITE_LIMIT", "8")),
+    "auth": int(os.getenv("ADMISSION_AUTH_LIMIT", "4")),
+}
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Частота тяжёлых запросов одного клиента (по токену): RATE_LIMIT_RATE в секунду, всплеск до RATE_LIMIT_BURST.
+# RATE_LIMIT_RATE=0 отключает ограничение
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+
+# Тяжёлые чтения: полные списки, отчёты, инвентаризация, импорт
+HEAVY_PATHS = re.compile(
+    r"^/api/(books|readers|fines|logs/[^/]+|reports/.*|inventory/.*|readers/import|books/bulk-delete)$"
+)
+
+admission_requests = Counter(
+    "admission_requests_total", "Requests passed through admission control", ("class", "result"),
+)
+admission_active = Gauge("admission_active", "Requests being processed per route class", ("class",))
+admission_queued = Gauge("admission_queued", "Requests waiting for admission per route class", ("class",))
+admission_wait = Histogram(
+    "admission_wait_seconds", "Time spent waiting in the admission queue", ("class",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+
+# Пакет /api/batch сам по себе лёгкий: лимиты применяются к каждому его подзапросу
+BATCH_PATH = "/api/batch"
+
+def route_class(method: str, path: str):
+    # Предварительные запросы CORS не обращаются к БД и не расходуют лимиты
+    if method == "OPTIONS" or path == BATCH_PATH:
+        return None
+    if path == "/token":
+        return "auth"
+    if HEAVY_PATHS.match(path):
+        return "heavy"
+    if method not in READ_METHODS:
+        return "write"
+    return None
+
+class AdmissionGate:
+    # Аналог семафора с ограниченной очередью: освободившееся место передаётся первому ожидающему
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiters = deque()
+
+    async def acquire(self):
+        # Возвращает None при допуске или причину отказа
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            admission_active.inc((self.name,))
+            return None
+        if len(self.waiters) >= self.queue_size:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        admission_queued.inc((self.name,))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+            return None
+        except asyncio.TimeoutError:
+            return "timeout"
+        except asyncio.CancelledError:
+            # Клиент отключился уже после передачи места
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            admission_queued.dec((self.name,))
+            admission_wait.observe((self.name,), time.perf_counter() - started)
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        admission_active.dec((self.name,))
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    def take(self, key: str) -> float:
+        # 0, если запрос разрешён, иначе через сколько секунд появится токен
+        now = time.monotonic()
+        if len(self._buckets) > 10000:
+            self._buckets = {
+                k: (tokens, updated) for k, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate < self.burst
+            }
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0
+
+def _reject(status_code: int, detail: str, retry_after: float):
+    return JSONResponse(
+        {"detail": detail}, status_code=status_code, headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.gates = {
+            name: AdmissionGate(name, limit, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+            for name, limit in ADMISSION_LIMITS.items() if limit > 0
+        }
+        self.buckets = TokenBuckets(RATE_LIMIT_RATE, RATE_LIMIT_BURST) if RATE_LIMIT_RATE > 0 else None
+
+    async def acquire(self, scope, name):
+        # (место в классе или None, None) при допуске, (None, ответ с отказом) иначе.
+        # Место освобождается вызовом gate.release()
+        if name == "heavy" and self.buckets is not None:
+            wait = self.buckets.take(client_key(Headers(scope=scope), scope))
+            if wait:
+                admission_requests.inc((name, "rate_limited"))
+                return None, _reject(429, "Too many requests", wait)
+
+        gate = self.gates.get(name)
+        if gate is None:
+            return None, None
+
+        reason = await gate.acquire()
+        if reason is not None:
+            admission_requests.inc((name, reason))
+            return None, _reject(503, "Server is busy", ADMISSION_RETRY_AFTER)
+
+        admission_requests.inc((name, "admitted"))
+        return gate, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        gate = rejection = None
+        name = route_class(scope["method"], scope["path"])
+        if name is not None:
+            gate, rejection = await self.acquire(scope, name)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+
+        # Через scope лимиты доступны /api/batch для его подзапросов
+        scope["admission"] = self
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if gate is not None:
+                gate.release()
@@ -3,15 +3,17 @@ from datetime import timedelta, datetime, timezone
 from typing import Annotated
 
 from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status, FastAPI, APIRouter
+from fastapi import Depends, HTTPException, Request, status, FastAPI, APIRouter
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
 from jwt import InvalidTokenError
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
+from app.cache import LocalCache
 from app.crud import get_user
-from app.database import SessionLocal
+from app.database import get_db
+from app.metrics import auth_attempts
 from app.schemas import TokenData, User, Token
 
 router = APIRouter()
@@ -27,12 +29,11 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Учётные записи сотрудников по имени пользователя; очищается при изменении employee_credentials
+# через сессию приложения или командой invalidate-cache. Изменения прямым SQL без неё
+# вступают в силу не позже чем через PRINCIPAL_CACHE_TTL секунд
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+principal_cache = LocalCache("principals", maxsize=1024, ttl=PRINCIPAL_CACHE_TTL)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -58,7 +59,12 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
+async def get_current_user(request: Request, token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
+    # Подзапросы /api/batch используют сотрудника, проверенного один раз для всего пакета
+    batch_user = getattr(request.state, "user", None)
+    if batch_user is not None:
+        return batch_user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,13 +74,22 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
+            auth_attempts.inc(("token", "failure"))
             raise credentials_exception
         token_data = TokenData(username=username)
     except InvalidTokenError:
+        auth_attempts.inc(("token", "failure"))
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    user = principal_cache.get(token_data.username)
+    if user is None:
+        user = get_user(db, username=token_data.username)
+        if user is not None:
+            db.expunge(user)
+            principal_cache.set(token_data.username, user, tags=[("employee_credentials",)])
     if user is None:
+        auth_attempts.inc(("token", "failure"))
         raise credentials_exception
+    auth_attempts.inc(("token", "success"))
     return user
 
 async def get_current_active_user(
@@ -89,11 +104,13 @@ async def login_for_access_token(
 ) -> Token:
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        auth_attempts.inc(("login", "failure"))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    auth_attempts.inc(("login", "success"))
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
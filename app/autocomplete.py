@@ -0,0 +1,244 @@
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.invalidation import bus
+from app.models import Author, Book, UserCard
+
+load_dotenv()
+
+# Подсказки для строки поиска: отсортированные ключи в памяти воркера, поиск — bisect.
+# Ключ строится для каждого слова названия или имени, поэтому «толс» находит «Лев Толстой».
+# Ключи хранятся блоками по AUTOCOMPLETE_BLOCK_SIZE: изменение копирует только затронутые блоки
+# и список ссылок на блоки, после чего снимок подменяется целиком (copy-on-write), так что
+# чтение идёт без блокировок. Изменения из шины инвалидации применяет фоновый поток пачками,
+# раз в AUTOCOMPLETE_UPDATE_DELAY секунд, а не транзакция записи
+BLOCK_SIZE = int(os.getenv("AUTOCOMPLETE_BLOCK_SIZE", "512"))
+UPDATE_DELAY = float(os.getenv("AUTOCOMPLETE_UPDATE_DELAY", "0.2"))
+# Сколько ID запрашивается одним SELECT ... IN
+FETCH_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+def word_keys(label: str):
+    words = normalize(label).split(" ")
+    return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+def _split(entries):
+    return [entries[i:i + BLOCK_SIZE] for i in range(0, len(entries), BLOCK_SIZE)]
+
+class PrefixIndex:
+    def __init__(self, kind: str):
+        self.kind = kind
+        # (первые записи блоков, блоки); блок — отсортированный список записей (ключ, ID, подпись)
+        self._snapshot = ([], [])
+        # ID -> подпись; меняется только под блокировкой и читателями не используется
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    def _publish(self, blocks):
+        self._snapshot = ([block[0] for block in blocks], blocks)
+
+    def load(self, items):
+        labels = dict(items)
+        entries = sorted((key, item_id, label) for item_id, label in labels.items() for key in word_keys(label))
+        with self._lock:
+            self._labels = labels
+            self._publish(_split(entries))
+
+    def apply(self, changes: dict):
+        # changes: {ID: подпись}; подпись None удаляет запись
+        with self._lock:
+            firsts, blocks = self._snapshot
+            touched = {}
+
+            def block(index):
+                if index not in touched:
+                    touched[index] = list(blocks[index]) if index < len(blocks) else []
+                return touched[index]
+
+            for item_id, label in changes.items():
+                old_label = self._labels.get(item_id)
+                if old_label == label:
+                    continue
+                if old_label is not None:
+                    for key in word_keys(old_label):
+                        entries = block(max(bisect_right(firsts, (key, item_id, old_label)) - 1, 0))
+                        entries.pop(bisect_left(entries, (key, item_id, old_label)))
+                if label is None:
+                    self._labels.pop(item_id, None)
+                    continue
+                self._labels[item_id] = label
+                for key in word_keys(label):
+                    entry = (key, item_id, label)
+                    insort(block(max(bisect_right(firsts, entry) - 1, 0)), entry)
+
+            if not touched:
+                return
+            updated = []
+            for index in range(max(len(blocks), 1)):
+                if index not in touched:
+                    updated.append(blocks[index])
+                elif len(touched[index]) > 2 * BLOCK_SIZE:
+                    updated.extend(_split(touched[index]))
+                elif updated and len(updated[-1]) + len(touched[index]) <= BLOCK_SIZE:
+                    # Поредевший после удалений блок сливается с соседним
+                    updated[-1] = updated[-1] + touched[index]
+                elif touched[index]:
+                    updated.append(touched[index])
+            self._publish(updated)
+
+    def search(self, prefix: str, limit: int = 10):
+        firsts, blocks = self._snapshot
+        prefix = normalize(prefix)
+        results = []
+        seen = set()
+        index = max(bisect_left(firsts, (prefix,)) - 1, 0)
+        position = bisect_left(blocks[index], (prefix,)) if blocks else 0
+        for block in blocks[index:]:
+            for key, item_id, label in block[position:]:
+                if not key.startswith(prefix) or len(results) >= limit:
+                    return results
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append({"kind": self.kind, "id": item_id, "label": label})
+            position = 0
+        return results
+
+    def __len__(self):
+        return len(self._labels)
+
+def _book_label(row):
+    return row.book_name
+
+def _author_label(row):
+    return " ".join(part for part in (row.author_lname, row.author_fname, row.author_mname) if part)
+
+def _reader_label(row):
+    return " ".join(part for part in (row.user_lname, row.user_fname, row.user_mname) if part)
+
+# Таблица -> (индекс, столбцы, первичный ключ, подпись)
+SOURCES = {
+    "books": (PrefixIndex("books"), (Book.book_id, Book.book_name), Book.book_id, _book_label),
+    "authors": (
+        PrefixIndex("authors"),
+        (Author.author_id, Author.author_lname, Author.author_fname, Author.author_mname),
+        Author.author_id,
+        _author_label,
+    ),
+    "user_cards": (
+        PrefixIndex("readers"),
+        (UserCard.user_id, UserCard.user_lname, UserCard.user_fname, UserCard.user_mname),
+        UserCard.user_id,
+        _reader_label,
+    ),
+}
+
+INDEXES = {index.kind: index for index, _, _, _ in SOURCES.values()}
+
+def _load_table(db, table: str):
+    index, columns, _, label = SOURCES[table]
+    index.load((row[0], label(row)) for row in db.execute(select(*columns)))
+
+def build():
+    # Недоступная при запуске БД не мешает старту: индекс останется пустым до первого изменения
+    try:
+        with SessionLocal() as db:
+            for table in SOURCES:
+                _load_table(db, table)
+    except Exception as e:
+        logger.warning("Autocomplete index was not built: %s", e)
+        return
+    logger.info("Autocomplete index built: %s", {kind: len(index) for kind, index in INDEXES.items()})
+
+# Таблица -> множество изменённых ID (None — перечитать таблицу целиком)
+_pending = {}
+_pending_lock = threading.Lock()
+_wakeup = threading.Event()
+_stop = threading.Event()
+_thread = None
+
+def _enqueue(entity, entity_ids):
+    with _pending_lock:
+        if entity_ids is None or _pending.get(entity, set()) is None:
+            _pending[entity] = None
+        else:
+            _pending.setdefault(entity, set()).update(entity_ids)
+    _wakeup.set()
+
+@bus.subscribe
+def _on_change(entity, entity_id):
+    # Изменение записи в книгах, авторах или читателях (в этом или другом воркере) только ставится в очередь
+    if entity not in SOURCES or _thread is None:
+        return
+    _enqueue(entity, None if entity_id is None else {entity_id})
+
+def _apply_changes(pending):
+    with SessionLocal() as db:
+        for table, entity_ids in pending.items():
+            if entity_ids is None:
+                _load_table(db, table)
+                continue
+            index, columns, primary_key, label = SOURCES[table]
+            entity_ids = sorted(entity_ids)
+            changes = dict.fromkeys(entity_ids)
+            for start in range(0, len(entity_ids), FETCH_BATCH_SIZE):
+                batch = entity_ids[start:start + FETCH_BATCH_SIZE]
+                for row in db.execute(select(*columns).where(primary_key.in_(batch))):
+                    changes[row[0]] = label(row)
+            index.apply(changes)
+
+def _run():
+    global _pending
+    while not _stop.is_set():
+        _wakeup.wait()
+        # Задержка собирает серию изменений в одну пачку
+        _stop.wait(UPDATE_DELAY)
+        _wakeup.clear()
+        with _pending_lock:
+            pending, _pending = _pending, {}
+        if not pending:
+            continue
+        try:
+            _apply_changes(pending)
+        except Exception as e:
+            # Изменения возвращаются в очередь и применяются при следующей попытке
+            logger.warning("Autocomplete index update failed: %s", e)
+            for table, entity_ids in pending.items():
+                _enqueue(table, entity_ids)
+            _stop.wait(UPDATE_DELAY)
+
+def start():
+    global _thread
+    build()
+    if _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="autocomplete-updater", daemon=True)
+    _thread.start()
+
+def stop():
+    global _thread
+    if _thread is not None:
+        _stop.set()
+        _wakeup.set()
+        _thread.join()
+        _thread = None
+
+def search(query: str, kind: str | None = None, limit: int = 10):
+    if kind is not None:
+        return INDEXES[kind].search(query, limit)
+    results = []
+    for index in INDEXES.values():
+        results.extend(index.search(query, limit - len(results)))
+        if len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.metrics import Counter
+
+# Кэши в памяти воркера. Каждая запись помечается сущностями (таблица или таблица + ID),
+# от которых она зависит; шина инвалидации (app.invalidation) удаляет записи по этим меткам
+
+cache_requests = Counter("cache_requests_total", "Local cache lookups", ("cache", "result"))
+
+CACHES = []
+
+_MISSING = object()
+
+class LocalCache:
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float | None = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Метка -> ключи записей, зависящих от неё
+        self._tags = {}
+        self._lock = threading.Lock()
+        CACHES.append(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[1] is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+        cache_requests.inc((self.name, "miss" if entry is _MISSING else "hit"))
+        return default if entry is _MISSING else entry[0]
+
+    def set(self, key, value, tags=()):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_set(self, key, factory, tags=()):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, tags)
+        return value
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, entity: str, entity_id=None) -> int:
+        # Изменение записи удаляет зависящие от неё элементы и элементы, помеченные всей таблицей;
+        # изменение без ID (массовое обновление) — все элементы этой таблицы
+        with self._lock:
+            tags = [(entity,)]
+            if entity_id is None:
+                tags += [tag for tag in self._tags if len(tag) == 2 and tag[0] == entity]
+            else:
+                tags.append((entity, entity_id))
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def invalidate(entity: str, entity_id=None) -> int:
+    return sum(cache.invalidate(entity, entity_id) for cache in CACHES)
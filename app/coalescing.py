@@ -0,0 +1,77 @@
+import threading
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.instrumentation import route_path
+from app.metrics import Counter
+from app.replicas import db_route
+
+# Объединение одинаковых одновременных GET-запросов: первый запрос выполняет обработчик,
+# остальные ждут его и получают тот же сериализованный ответ. Права у всех сотрудников одинаковые,
+# поэтому ключ — маршрут и параметры. Запросы «липких» клиентов (недавно писавших) не объединяются:
+# чужой запрос, начатый до их коммита, вернул бы данные без их записи
+
+coalesced_requests = Counter(
+    "coalesced_requests_total", "GET requests served by single-flight coalescing", ("route", "result"),
+)
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        # Возвращает (результат, выполнен ли он этим вызовом)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+flight = SingleFlight()
+
+def coalesce(request: Request, build) -> Response:
+    # build() возвращает Response; между запросами делятся только статус, тип и тело,
+    # сам объект ответа у каждого запроса свой (middleware дописывают в него заголовки)
+    # Подзапросы /api/batch могут видеть незакоммиченные изменения своего пакета
+    route = db_route.get()
+    if getattr(request.state, "db", None) is not None or route is None or not route.read_only:
+        return build()
+
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+    def render():
+        response = build()
+        return response.status_code, response.media_type, response.body, route.target
+
+    (status_code, media_type, body, target), executed = flight.do(key, render)
+    coalesced_requests.inc((route_path(request.scope), "executed" if executed else "shared"))
+    if route.target is None:
+        route.target = target
+    return Response(body, status_code=status_code, media_type=media_type)
@@ -0,0 +1,111 @@
+import gzip
+import os
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+# brotli входит в requirements.txt; без него ответы сжимаются только gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# Ответы меньше COMPRESSION_MIN_SIZE байт отправляются без сжатия
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Большие ответы сжимаются в пуле потоков, чтобы не блокировать цикл событий
+THREADPOOL_MIN_SIZE = 256 * 1024
+
+def _compress_gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def _compress_brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+ENCODERS = {"gzip": _compress_gzip}
+if brotli is not None:
+    ENCODERS["br"] = _compress_brotli
+
+def choose_encoding(accept_encoding: str):
+    # Выбирается кодировка с наибольшим q; при равенстве предпочтение у br
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for name in ("br", "gzip"):
+        weight = weights.get(name, weights.get("*", 0.0))
+        if name in ENCODERS and weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+class CompressionMiddleware:
+    # Сжимает ответы, отправленные одним сообщением. Потоковые ответы (архивы, файлы)
+    # передаются без изменений
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            passthrough = True
+            headers = MutableHeaders(scope=start_message)
+            body = message.get("body", b"")
+            if (
+                message["type"] != "http.response.body"
+                or message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= THREADPOOL_MIN_SIZE:
+                compressed = await run_in_threadpool(ENCODERS[encoding], body)
+            else:
+                compressed = ENCODERS[encoding](body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
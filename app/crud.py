@@ -1,5 +1,10 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from fastapi import Depends
 from passlib.context import CryptContext
+from sqlalchemy import any_, bindparam, delete, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
@@ -309,4 +314,196 @@ def get_fines(db: Session, skip: int = 0, limit: int = 10):
 
 # Получение штрафа по ID
 def get_fine(db: Session, fine_id: int):
-    return db.query(models.FineCard).join(models.Fine).join(models.UserCard).filter(models.Fine.fine_id == fine_id).first()
\ No newline at end of file
+    return db.query(models.FineCard).join(models.Fine).join(models.UserCard).filter(models.Fine.fine_id == fine_id).first()
+
+# Строки для списков и карточек: данные собираются несколькими запросами на весь список
+# (без запроса на каждую строку) и возвращаются словарями, готовыми к сериализации
+
+def format_author(lname, fname, mname):
+    return f"{lname} {fname} {mname or ''}".strip()
+
+def format_location(section_name, rack_name, shelf_number):
+    return f"{section_name or 'Основной склад'}, {rack_name or 'На складе'}, {shelf_number or 'На складе'} полка"
+
+def format_user_name(lname, fname, mname):
+    return f"{lname} {fname} {mname}"
+
+def get_authors_by_book(db: Session, book_ids=None):
+    query = (
+        db.query(models.AuthorBook.book_id, models.Author.author_lname, models.Author.author_fname, models.Author.author_mname)
+        .join(models.Author, models.Author.author_id == models.AuthorBook.author_id)
+    )
+    if book_ids is not None:
+        query = query.filter(models.AuthorBook.book_id.in_(book_ids))
+
+    authors = defaultdict(list)
+    for book_id, lname, fname, mname in query:
+        authors[book_id].append(format_author(lname, fname, mname))
+    return authors
+
+# Поле ответа -> значение из строки запроса (authors — авторы по book_id)
+BOOK_COPY_VALUES = {
+    "copy_id": lambda row, authors: row.copy_id,
+    "book": lambda row, authors: row.book_name,
+    "genre": lambda row, authors: row.genre_name,
+    "author": lambda row, authors: authors.get(row.book_id, []),
+    "book_location": lambda row, authors: format_location(row.section_name, row.rack_name, row.shelf_number),
+    "photo": lambda row, authors: row.photo,
+    "status": lambda row, authors: row.status,
+}
+
+def get_book_copy_rows(db: Session, copy_id: int | None = None, fields=None):
+    # fields — поля ответа (None — все): таблицы и запрос авторов, которые для них не нужны, не подключаются.
+    # Строки по-прежнему берутся из book_locations, а внешние ключи цепочки NOT NULL,
+    # поэтому набор экземпляров от списка полей не зависит
+    fields = fields or schemas.BOOK_COPY_FIELDS
+    query = (
+        db.query(models.BookCopy.copy_id, models.BookCopy.book_id)
+        .select_from(models.BookLocation)
+        .join(models.BookCopy, models.BookCopy.copy_id == models.BookLocation.copy_id)
+    )
+    if "book" in fields or "genre" in fields:
+        query = query.join(models.Book, models.Book.book_id == models.BookCopy.book_id).add_columns(models.Book.book_name)
+    if "genre" in fields:
+        query = query.join(models.Genre, models.Genre.genre_id == models.Book.genre_id).add_columns(models.Genre.genre_name)
+    if "book_location" in fields:
+        query = (
+            query.join(models.Shelf, models.Shelf.shelf_id == models.BookLocation.shelf_id)
+            .join(models.Rack, models.Rack.rack_id == models.Shelf.rack_id)
+            .join(models.Section, models.Section.section_id == models.Rack.section_id)
+            .add_columns(models.Section.section_name, models.Rack.rack_name, models.Shelf.shelf_number)
+        )
+    if "photo" in fields:
+        query = query.add_columns(models.BookCopy.photo)
+    if "status" in fields:
+        query = query.add_columns(models.BookCopy.status)
+    if copy_id is not None:
+        query = query.filter(models.BookCopy.copy_id == copy_id)
+
+    # Порядок не зависит от набора полей и подключённых таблиц
+    rows = query.order_by(models.BookCopy.copy_id).all()
+    authors = {}
+    if "author" in fields:
+        authors = get_authors_by_book(db, None if copy_id is None else {row.book_id for row in rows})
+
+    values = [(field, BOOK_COPY_VALUES[field]) for field in fields]
+    return [{field: value(row, authors) for field, value in values} for row in rows]
+
+READER_VALUES = {
+    "user_id": lambda row: row.user_id,
+    "user_name": lambda row: format_user_name(row.user_lname, row.user_fname, row.user_mname),
+    "user_email": lambda row: row.user_email,
+    "registration_date": lambda row: row.registration_date,
+    "borrowed_books": lambda row: [row.book_name] if row.book_name is not None else [],
+    "fines": lambda row: row.fines if row.fines is not None else Decimal(0),
+    "status": lambda row: row.status,
+}
+
+def get_reader_rows(db: Session, reader_id: int | None = None, fields=None):
+    # fields — поля ответа (None — все): сумма штрафов и книги считаются, только если запрошены
+    fields = fields or schemas.USER_INFO_FIELDS
+    query = db.query(UserCard.user_id)
+    if "user_name" in fields:
+        query = query.add_columns(UserCard.user_lname, UserCard.user_fname, UserCard.user_mname)
+    for field in ("user_email", "registration_date", "status"):
+        if field in fields:
+            query = query.add_columns(getattr(UserCard, field))
+
+    # borrowed_books, как и раньше, берётся по экземпляру с copy_id = loan_id читателя
+    if "borrowed_books" in fields:
+        query = (
+            query.outerjoin(models.BookCopy, models.BookCopy.copy_id == UserCard.loan_id)
+            .outerjoin(models.Book, models.Book.book_id == models.BookCopy.book_id)
+            .add_columns(models.Book.book_name)
+        )
+    if "fines" in fields:
+        fines = db.query(
+            models.Fine.user_id,
+            func.sum(models.Fine.fine_amount).label("fines"),
+        )
+        if reader_id is not None:
+            fines = fines.filter(models.Fine.user_id == reader_id)
+        fines = fines.group_by(models.Fine.user_id).subquery()
+        query = query.outerjoin(fines, fines.c.user_id == UserCard.user_id).add_columns(fines.c.fines)
+    if reader_id is not None:
+        query = query.filter(UserCard.user_id == reader_id)
+
+    values = [(field, READER_VALUES[field]) for field in fields]
+    return [{field: value(row) for field, value in values} for row in query.order_by(UserCard.user_id)]
+
+def get_unreturned_books_by_user(db: Session, user_ids):
+    query = (
+        db.query(models.UserCard.user_id, models.Book.book_name)
+        .join(models.BookCopy, models.Book.book_id == models.BookCopy.book_id)
+        .join(models.Loan, models.BookCopy.copy_id == models.Loan.copy_id)
+        .join(models.UserCard, models.Loan.loan_id == models.UserCard.loan_id)
+        .filter(models.UserCard.user_id.in_(user_ids))
+        .filter(models.Loan.return_date == None)
+    )
+    books = defaultdict(list)
+    for user_id, book_name in query:
+        books[user_id].append(book_name)
+    return books
+
+def get_fine_rows(db: Session, fine_id: int | None = None, skip: int = 0, limit: int = 10):
+    query = (
+        db.query(
+            models.Fine.fine_id,
+            models.Fine.fine_amount,
+            models.Fine.fine_date,
+            models.Fine.fine_paid,
+            UserCard.user_id,
+            UserCard.user_lname,
+            UserCard.user_fname,
+            UserCard.user_mname,
+            UserCard.user_email,
+        )
+        .select_from(FineCard)
+        .join(models.Fine, models.Fine.fine_id == FineCard.fine_id)
+        .join(UserCard, UserCard.user_id == FineCard.user_id)
+    )
+    if fine_id is not None:
+        rows = query.filter(models.Fine.fine_id == fine_id).limit(1).all()
+    else:
+        rows = query.offset(skip).limit(limit).all()
+
+    unreturned = get_unreturned_books_by_user(db, {row.user_id for row in rows}) if rows else {}
+
+    return [
+        {
+            "fine_id": row.fine_id,
+            "user_name": format_user_name(row.user_lname, row.user_fname, row.user_mname),
+            "user_email": row.user_email,
+            "fine_amount": row.fine_amount,
+            "date_received": row.fine_date,
+            "unreturned_books": unreturned.get(row.user_id, []),
+            "paid": row.fine_paid,
+        }
+        for row in rows
+    ]
+
+def id_filter(db: Session, column, ids):
+    # В PostgreSQL список передаётся одним параметром-массивом (= ANY(:ids)): текст запроса
+    # не зависит от числа значений. Тип элементов массива берётся из столбца. В остальных СУБД используется IN
+    if db.get_bind().dialect.name == "postgresql":
+        return column == any_(bindparam(None, list(ids), type_=ARRAY(column.type)))
+    return column.in_(list(ids))
+
+def get_copy_ids_by_status(db: Session, status: str):
+    return list(db.execute(select(models.BookCopy.copy_id).where(models.BookCopy.status == status)).scalars())
+
+def delete_book_copies(db: Session, copy_ids):
+    # Списание экземпляров вместе с выдачами и размещением: по одному DELETE на таблицу.
+    # Коммит выполняет вызывающий код
+    copy_ids = sorted(set(copy_ids))
+    if not copy_ids:
+        return {"copies": 0, "book_locations": 0, "loans": 0}
+
+    counts = {}
+    for key, model in [("loans", models.Loan), ("book_locations", models.BookLocation), ("copies", models.BookCopy)]:
+        result = db.execute(
+            delete(model).where(id_filter(db, model.copy_id, copy_ids)),
+            execution_options={"synchronize_session": False},
+        )
+        counts[key] = result.rowcount
+    return counts
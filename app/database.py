@@ -1,15 +1,89 @@
+import logging
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 from dotenv import load_dotenv
+from fastapi import Request
+
+from app.replicas import ReplicaSet, db_route
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URI")
+# Реплики для чтения через запятую; если не заданы, все запросы идут в основную БД
+REPLICA_URLS = [url.strip() for url in os.getenv("SQLALCHEMY_REPLICA_URIS", "").split(",") if url.strip()]
+
+# Размер пула и число соединений, открываемых заранее при старте воркера
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+
+# pool_pre_ping заменяет соединения, оборванные при кратковременной недоступности БД
+def _create_engine(url):
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+
+engine = _create_engine(DATABASE_URL)
+replicas = ReplicaSet(_create_engine(url) for url in REPLICA_URLS)
+
+class RoutingSession(Session):
+    # Чтение в GET-запросах идёт в реплику (одну на сессию), запись и flush — в основную БД.
+    # Явно переданный bind (Session(bind=...)) имеет приоритет
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.bind is not None:
+            return self.bind
+
+        route = db_route.get()
+        if route is None or not route.read_only or self._flushing:
+            if route is not None:
+                route.target = "primary"
+            return engine
+
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = replicas.choose() or engine
+        route.target = "primary" if replica is engine else "replica"
+        return replica
+
+    def close(self):
+        # Действия, отложенные до конца работы с сессией (публикация инвалидации, app/invalidation.py)
+        callbacks = self.info.pop("close_callbacks", [])
+        super().close()
+        for callback in callbacks:
+            callback(self)
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+def get_db(request: Request):
+    # Подзапросы /api/batch работают в общей сессии пакета (request.state.db)
+    db = getattr(request.state, "db", None)
+    if db is not None:
+        yield db
+        return
 
-engine = create_engine(DATABASE_URL)
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+logger = logging.getLogger(__name__)
 
-Base = declarative_base()
\ No newline at end of file
+def warm_pool(engine, connections: int = DB_POOL_WARM) -> int:
+    # Открыть соединения заранее; недоступная БД не должна мешать запуску воркера
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning("Database is not available at startup: %s", e)
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import Integer, cast, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.models import Loan
+from app.schemas import FinePolicy
+
+load_dotenv()
+
+# Оценка штрафов по всем выдачам для одной или нескольких политик («что, если»).
+# Даты загружаются из БД пачками сразу как номера дней от 1970-01-01, затем правила
+# применяются к целым массивам numpy — без цикла по выдачам
+PROJECTION_CHUNK_SIZE = int(os.getenv("PROJECTION_CHUNK_SIZE", "100000"))
+
+EPOCH = date(1970, 1, 1)
+
+def _epoch_day(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return column - literal(EPOCH)
+    return cast(func.julianday(column) - 2440587.5, Integer)
+
+def load_loan_days(db: Session):
+    # (срок возврата, дата возврата) в днях; у невозвращённых дата возврата -1
+    statement = select(
+        _epoch_day(db, Loan.due_date),
+        func.coalesce(_epoch_day(db, Loan.return_date), -1),
+    )
+    due, returned = [], []
+    result = db.execute(statement, execution_options={"yield_per": PROJECTION_CHUNK_SIZE})
+    for chunk in result.partitions():
+        days = np.array(chunk, dtype=np.int32).reshape(-1, 2)
+        due.append(days[:, 0])
+        returned.append(days[:, 1])
+    if not due:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    return np.concatenate(due), np.concatenate(returned)
+
+def _money(value) -> Decimal:
+    return Decimal(f"{value:.2f}")
+
+def apply_policy(policy: FinePolicy, overdue: np.ndarray, is_open: np.ndarray, buckets):
+    # Штраф: ставка за каждый день просрочки сверх льготных, не меньше minimum и не больше maximum
+    fined = overdue > policy.grace_days
+    amounts = np.maximum((overdue[fined] - policy.grace_days) * float(policy.daily_rate), float(policy.minimum))
+    if policy.maximum is not None:
+        amounts = np.minimum(amounts, float(policy.maximum))
+    open_fined = is_open[fined]
+
+    edges = np.array(sorted(float(edge) for edge in buckets), dtype=np.float64)
+    counts = np.bincount(np.searchsorted(edges, amounts, side="right"), minlength=len(edges) + 1)
+    lower = [Decimal(0)] + [_money(edge) for edge in edges]
+    upper = [_money(edge) for edge in edges] + [None]
+
+    percentiles = np.percentile(amounts, [50, 90, 99]) if len(amounts) else np.zeros(3)
+    return {
+        "name": policy.name,
+        "loans": int(len(overdue)),
+        "fined_loans": int(len(amounts)),
+        "open_fined_loans": int(np.count_nonzero(open_fined)),
+        "total": _money(amounts.sum()),
+        "open_total": _money(amounts[open_fined].sum()),
+        "mean": _money(amounts.mean() if len(amounts) else 0),
+        "p50": _money(percentiles[0]),
+        "p90": _money(percentiles[1]),
+        "p99": _money(percentiles[2]),
+        "max": _money(amounts.max() if len(amounts) else 0),
+        "histogram": [
+            {"lower": low, "upper": high, "loans": int(count)}
+            for low, high, count in zip(lower, upper, counts.tolist())
+        ],
+    }
+
+def project(db: Session, policies, as_of: date | None = None, buckets=()):
+    # Невозвращённые книги считаются просроченными по состоянию на as_of (по умолчанию сегодня)
+    due, returned = load_loan_days(db)
+    today = ((as_of or date.today()) - EPOCH).days
+    is_open = returned < 0
+    overdue = np.where(is_open, today, returned) - due
+    return {
+        "as_of": as_of or date.today(),
+        "policies": [apply_policy(policy, overdue, is_open, buckets) for policy in policies],
+    }
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from app.database import engine
+from app.models import IdempotencyKey
+from app.replicas import client_key
+
+load_dotenv()
+
+# Повтор POST-запроса с тем же заголовком Idempotency-Key не выполняет обработчик ещё раз,
+# а возвращает сохранённый ответ первого. Одновременный повтор ждёт завершения первого
+# не дольше IDEMPOTENCY_WAIT_TIMEOUT секунд. Ответы хранятся IDEMPOTENCY_TTL секунд
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+# Незавершённая запись старше этого срока считается брошенной (воркер упал) и освобождает ключ
+IDEMPOTENCY_PENDING_TIMEOUT = float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "60"))
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(1024 * 1024)))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+POLL_INTERVAL = 0.05
+
+HEADER = "idempotency-key"
+IDEMPOTENT_PATHS = {"/api/loans/new", "/api/readers/new", "/api/books/new", "/api/books/new/copy"}
+
+# Ответы, которые не сохраняются: повтор должен выполниться заново
+RETRYABLE_STATUSES = {409, 429}
+
+TABLE = IdempotencyKey.__table__
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _insert(connection):
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    return dialect.insert(TABLE)
+
+def claim(key: str, request_hash: str):
+    # None — ключ закреплён за этим запросом; иначе строка первого запроса
+    while True:
+        now = _now()
+        with engine.begin() as connection:
+            connection.execute(delete(TABLE).where(TABLE.c.key == key, or_(
+                TABLE.c.expires_at < now,
+                and_(TABLE.c.status_code == None, TABLE.c.created_at < now - timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT)),
+            )))
+            inserted = connection.execute(
+                _insert(connection)
+                .values(key=key, request_hash=request_hash, created_at=now, expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL))
+                .on_conflict_do_nothing(index_elements=[TABLE.c.key])
+            ).rowcount
+            if inserted:
+                return None
+            row = connection.execute(select(TABLE).where(TABLE.c.key == key)).first()
+        if row is not None:
+            return row
+
+def complete(key: str, status_code: int, content_type, body: bytes):
+    with engine.begin() as connection:
+        connection.execute(
+            update(TABLE).where(TABLE.c.key == key).values(status_code=status_code, content_type=content_type, body=body)
+        )
+
+def release(key: str):
+    with engine.begin() as connection:
+        connection.execute(delete(TABLE).where(TABLE.c.key == key))
+
+def purge_expired() -> int:
+    with engine.begin() as connection:
+        return connection.execute(delete(TABLE).where(TABLE.c.expires_at < _now())).rowcount
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > IDEMPOTENCY_MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+def _replay(row):
+    headers = {"Idempotency-Replayed": "true"}
+    if row.content_type:
+        headers["Content-Type"] = row.content_type
+    return Response(row.body, status_code=row.status_code, headers=headers)
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._next_purge = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in IDEMPOTENT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        header = headers.get(HEADER)
+        if not header:
+            await self.app(scope, receive, send)
+            return
+        if len(header) > 255:
+            await JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            await JSONResponse({"detail": "Request body is too large"}, status_code=413)(scope, receive, send)
+            return
+
+        # Ключ принадлежит клиенту: одинаковые заголовки разных сотрудников не пересекаются
+        key = hashlib.sha256(f"{client_key(headers, scope)}\0{header}".encode()).hexdigest()
+        request_hash = hashlib.sha256(
+            b"\0".join([scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            row = await run_in_threadpool(claim, key, request_hash)
+            if row is None:
+                break
+            if row.request_hash != request_hash:
+                response = JSONResponse({"detail": "Idempotency-Key was used with a different request"}, status_code=422)
+            elif row.status_code is not None:
+                response = _replay(row)
+            elif time.monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            else:
+                response = JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still being processed"},
+                    status_code=409, headers={"Retry-After": "1"},
+                )
+            await response(scope, receive, send)
+            return
+
+        await self._execute(scope, receive, send, key, body)
+
+    async def _execute(self, scope, receive, send, key: str, body: bytes):
+        body_sent = False
+        status_code = None
+        content_type = None
+        chunks = []
+        size = 0
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_with_capture(message):
+            nonlocal status_code, content_type, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = Headers(raw=message.get("headers", [])).get("content-type")
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= IDEMPOTENCY_MAX_BODY:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_with_capture)
+        except BaseException:
+            await run_in_threadpool(release, key)
+            raise
+
+        if status_code is None or status_code >= 500 or status_code in RETRYABLE_STATUSES or size > IDEMPOTENCY_MAX_BODY:
+            await run_in_threadpool(release, key)
+        else:
+            await run_in_threadpool(complete, key, status_code, content_type, b"".join(chunks))
+
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + IDEMPOTENCY_PURGE_INTERVAL
+            await run_in_threadpool(purge_expired)
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+# Запросы, выполнившие больше SQL_LOG_THRESHOLD выражений, логируются со списком SQL
+SQL_LOG_THRESHOLD = int(os.getenv("SQL_LOG_THRESHOLD", "20"))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "1") == "1"
+
+access_logger = logging.getLogger("app.access")
+if not access_logger.handlers:
+    access_logger.addHandler(logging.StreamHandler())
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+class RequestStats:
+    __slots__ = ("query_count", "db_time", "statements")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.statements = []
+
+# Статистика текущего HTTP-запроса. Синхронные маршруты выполняются в пуле потоков
+# с копией контекста, поэтому видят тот же объект
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if request_stats.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats.get()
+    if stats is None or not conn.info.get("query_started"):
+        return
+    stats.query_count += 1
+    stats.db_time += time.perf_counter() - conn.info["query_started"].pop()
+    stats.statements.append(statement)
+
+def _handle_error(exception_context):
+    # Для упавшего выражения after_cursor_execute не вызывается: отметка снимается здесь,
+    # иначе список на соединении из пула рос бы без ограничения
+    connection = exception_context.connection
+    if connection is None or exception_context.statement is None:
+        return
+    _after_cursor_execute(
+        connection, None, exception_context.statement, exception_context.parameters,
+        exception_context.execution_context, False,
+    )
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+# Шаблон маршрута с префиксом подключения (/api), вычисляется один раз для каждого маршрута
+_route_templates = {}
+
+def route_path(scope) -> str:
+    route = scope.get("route")
+    if route is None or not hasattr(route, "path_regex"):
+        return "unmatched"
+
+    template = _route_templates.get(id(route))
+    if template is None:
+        # В части версий FastAPI scope["route"] хранит путь без префикса include_router
+        match = re.search(route.path_regex.pattern.lstrip("^"), scope["path"])
+        prefix = scope["path"][:match.start()] if match else ""
+        template = _route_templates[id(route)] = prefix + route.path
+    return template
+
+class QueryStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Count", str(stats.query_count))
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries", '
+                    f"app;dur={(time.perf_counter() - started) * 1000:.2f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            request_stats.reset(token)
+            if ACCESS_LOG:
+                log_request(scope, status_code, time.perf_counter() - started, stats)
+
+def log_request(scope, status_code: int, duration: float, stats: RequestStats):
+    record = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": route_path(scope),
+        "status": status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "db_ms": round(stats.db_time * 1000, 2),
+        "queries": stats.query_count,
+    }
+    if stats.query_count > SQL_LOG_THRESHOLD:
+        record["statements"] = stats.statements
+        access_logger.warning(json.dumps(record, ensure_ascii=False))
+    else:
+        access_logger.info(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, func, inspect, select as sql_select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import NullPool
+
+from app import cache
+from app.database import RoutingSession, engine
+from app.metrics import CallbackGauge, Counter
+from app.models import CacheVersion, ReportJob
+
+load_dotenv()
+
+# Шина инвалидации кэшей между воркерами. Сессия приложения копит изменённые таблицы и ID;
+# воркер-источник очищает свои кэши сразу после каждого коммита, а при закрытии сессии (в конце
+# запроса) одна короткая транзакция увеличивает версии всех изменённых таблиц и отправляет pg_notify:
+# строки cache_versions не блокируются на время транзакции записи, а несколько коммитов одного
+# запроса публикуются один раз. Остальные воркеры очищают кэши по уведомлению; после
+# переподключения слушатель сверяет версии таблиц. Без PostgreSQL слушателей нет, и версии не ведутся
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+RECONNECT_DELAY = float(os.getenv("INVALIDATION_RECONNECT_DELAY", "1"))
+
+# Полезная нагрузка NOTIFY ограничена 8000 байт; при превышении передаются только таблицы
+MAX_PAYLOAD = 7500
+IGNORED_TABLES = {CacheVersion.__tablename__, ReportJob.__tablename__}
+
+invalidations = Counter("cache_invalidations_total", "Cache invalidation events applied", ("source",))
+
+logger = logging.getLogger(__name__)
+
+class InvalidationBus:
+    def __init__(self, engine, worker_id: str | None = None, channel: str = INVALIDATION_CHANNEL):
+        self.engine = engine
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.channel = channel
+        self.subscribers = []
+        self.known_versions = None
+        self.connected = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        # callback(entity, entity_id) вызывается после очистки кэшей; entity_id = None — вся таблица
+        self.subscribers.append(callback)
+        return callback
+
+    def record_versions(self, versions):
+        with self._lock:
+            if self.known_versions is not None:
+                for entity, version in versions.items():
+                    self.known_versions[entity] = max(version, self.known_versions.get(entity, 0))
+
+    def apply(self, events, versions, source: str):
+        self.record_versions(versions)
+        for entity, entity_id in events:
+            cache.invalidate(entity, entity_id)
+            for callback in self.subscribers:
+                try:
+                    callback(entity, entity_id)
+                except Exception:
+                    logger.exception("Cache invalidation subscriber failed")
+        invalidations.inc((source,), len(events))
+
+    # Публикация (вызывается после коммита записи)
+
+    def publish(self, events):
+        # Таблицы обновляются в одном порядке, поэтому одновременные публикации не взаимоблокируются
+        entities = sorted({entity for entity, _ in events})
+        with self.engine.begin() as connection:
+            versions = {entity: bump_version(connection, entity) for entity in entities}
+            if connection.dialect.name == "postgresql":
+                payload = json.dumps({"w": self.worker_id, "v": versions, "e": sorted(events, key=repr)}, default=str)
+                if len(payload) > MAX_PAYLOAD:
+                    payload = json.dumps({"w": self.worker_id, "v": versions, "e": [[entity, None] for entity in entities]})
+                connection.execute(sql_select(func.pg_notify(self.channel, payload)))
+        return versions
+
+    # Слушатель (только PostgreSQL)
+
+    def _receive(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed invalidation payload: %s", payload)
+            return
+        if message.get("w") == self.worker_id:
+            return
+        events = [(entity, entity_id) for entity, entity_id in message.get("e", [])]
+        self.apply(events, message.get("v", {}), "notify")
+
+    def resync(self):
+        # Таблицы, версия которых изменилась, пока слушатель был отключён, очищаются целиком
+        with self.engine.connect() as conn:
+            versions = dict(conn.execute(sql_select(CacheVersion.entity, CacheVersion.version)).all())
+        with self._lock:
+            known, self.known_versions = self.known_versions, dict(versions)
+        if known is None:
+            return
+        stale = [(entity, None) for entity, version in versions.items() if known.get(entity) != version]
+        if stale:
+            logger.info("Invalidating %s tables changed while the listener was disconnected", len(stale))
+            self.apply(stale, {}, "resync")
+
+    def _listen(self):
+        listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = listen_engine.raw_connection()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                self.resync()
+                self.connected = True
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._receive(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Invalidation listener disconnected: %s", e)
+                self._stop.wait(RECONNECT_DELAY)
+            finally:
+                self.connected = False
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+        listen_engine.dispose()
+
+    def start(self):
+        if self.engine.dialect.name != "postgresql" or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+def bump_version(connection, entity: str) -> int:
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    table = CacheVersion.__table__
+    statement = (
+        dialect.insert(table)
+        .values(entity=entity, version=1)
+        .on_conflict_do_update(index_elements=[table.c.entity], set_={"version": table.c.version + 1})
+        .returning(table.c.version)
+    )
+    return connection.execute(statement).scalar_one()
+
+bus = InvalidationBus(engine)
+
+def _entity(instance):
+    mapper = inspect(instance).mapper
+    table = mapper.local_table.name
+    if table in IGNORED_TABLES:
+        return None
+    # Ключ новых объектов ещё не зарегистрирован в after_flush, поэтому берётся из атрибутов
+    key = mapper.primary_key_from_instance(instance)
+    return table, key[0] if len(key) == 1 else None
+
+def mark_changed(session, events):
+    # Регистрация событий (таблица, ID) в сессии; используется и для записей в обход ORM
+    # (INSERT ... ON CONFLICT и т. п.). Публикуются и очищают кэши после коммита
+    session.info.setdefault("invalidation_events", set()).update(events)
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_flushed(session, flush_context):
+    changed = [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ] + list(session.new) + list(session.deleted)
+    events = {entity for entity in map(_entity, changed) if entity is not None}
+    if events:
+        mark_changed(session, events)
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _collect_bulk(state):
+    # Массовые UPDATE/DELETE через query().update()/delete() инвалидируют всю таблицу
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    table = state.bind_mapper.local_table.name
+    if table in IGNORED_TABLES:
+        return
+    result = state.invoke_statement()
+    mark_changed(state.session, {(table, None)})
+    return result
+
+def _publish_pending(session):
+    # Если публикация не удалась, другие воркеры очистят кэши по TTL или при сверке версий
+    events = session.info.pop("unpublished_events", None)
+    if not events:
+        return
+    try:
+        bus.record_versions(bus.publish(events))
+    except Exception:
+        logger.exception("Failed to publish cache invalidation")
+
+def finish(session, committed: bool):
+    # Очистка локальных кэшей после коммита и постановка событий в публикацию при закрытии сессии;
+    # после отката события отбрасываются
+    events = session.info.pop("invalidation_events", None)
+    if not committed or not events:
+        return
+    bus.apply(events, {}, "local")
+    if bus.engine.dialect.name != "postgresql":
+        return
+    pending = session.info.get("unpublished_events")
+    if pending is None:
+        pending = session.info["unpublished_events"] = set()
+        session.info.setdefault("close_callbacks", []).append(_publish_pending)
+    pending.update(events)
+
+def publish_now(events):
+    # Инвалидация изменений, сделанных в обход сессии приложения (SQL, служебные команды)
+    if bus.engine.dialect.name == "postgresql":
+        bus.record_versions(bus.publish(events))
+    bus.apply(events, {}, "local")
+
+# В сессии с deferred_invalidation (транзакция /api/batch) коммит лишь освобождает точку сохранения:
+# события копятся до коммита внешней транзакции, после которого вызывается finish()
+@event.listens_for(RoutingSession, "after_commit")
+def _dispatch_committed(session):
+    if not session.info.get("deferred_invalidation"):
+        finish(session, committed=True)
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_rolled_back(session):
+    if not session.info.get("deferred_invalidation"):
+        finish(session, committed=False)
+
+CallbackGauge(
+    "cache_invalidation_listener_up", "Whether the cache invalidation listener is connected",
+    lambda: int(bus.connected) if bus._thread is not None else None,
+)
@@ -0,0 +1,96 @@
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.crud import id_filter
+from app.models import BookLocation, Rack, Shelf
+from app.schemas import InventoryScope
+
+# Сверка результатов инвентаризации: отсканированные и ожидаемые ID экземпляров сравниваются
+# как отсортированные массивы numpy (setdiff1d), без запроса на каждый экземпляр
+
+# Разделители во входном потоке: пробелы, переводы строк, запятые и скобки JSON-массива
+SEPARATORS = bytes.maketrans(b",[]\r\n\t", b"      ")
+
+# Размер пачки ID для запросов IN (ограничение числа параметров в SQLite)
+LOOKUP_CHUNK = 10000
+
+async def read_copy_ids(stream) -> np.ndarray:
+    # Тело запроса разбирается по мере поступления; число на границе фрагментов переносится в следующий
+    parts = []
+    tail = b""
+    async for chunk in stream:
+        data = tail + chunk.translate(SEPARATORS)
+        data, _, tail = data.rpartition(b" ")
+        if data:
+            parts.append(np.array(data.split(), dtype=np.int64))
+    if tail:
+        parts.append(np.array([tail], dtype=np.int64))
+    return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+def _scope_filter(scope: InventoryScope, scope_id: int):
+    if scope == InventoryScope.shelf:
+        return BookLocation.shelf_id == scope_id
+    shelves = select(Shelf.shelf_id)
+    if scope == InventoryScope.rack:
+        shelves = shelves.where(Shelf.rack_id == scope_id)
+    else:
+        shelves = shelves.join(Rack, Rack.rack_id == Shelf.rack_id).where(Rack.section_id == scope_id)
+    return BookLocation.shelf_id.in_(shelves)
+
+def _locations(db: Session, copy_ids: np.ndarray):
+    # Текущие полки экземпляров, найденных вне проверяемой зоны
+    found_ids, shelf_ids = [], []
+    for start in range(0, len(copy_ids), LOOKUP_CHUNK):
+        chunk = copy_ids[start:start + LOOKUP_CHUNK].tolist()
+        for copy_id, shelf_id in db.execute(
+            select(BookLocation.copy_id, BookLocation.shelf_id).where(id_filter(db, BookLocation.copy_id, chunk))
+        ):
+            found_ids.append(copy_id)
+            shelf_ids.append(shelf_id)
+    return np.array(found_ids, dtype=np.int64), np.array(shelf_ids, dtype=np.int64)
+
+def reconcile(db: Session, scope: InventoryScope, scope_id: int, scanned: np.ndarray, fix: bool = False):
+    if fix and scope != InventoryScope.shelf:
+        raise HTTPException(status_code=400, detail="Misplaced copies can only be moved when a single shelf is checked")
+
+    expected = np.unique(np.fromiter(
+        db.execute(select(BookLocation.copy_id).where(_scope_filter(scope, scope_id))).scalars(), dtype=np.int64,
+    ))
+    missing = np.setdiff1d(expected, scanned, assume_unique=True)
+    extra = np.setdiff1d(scanned, expected, assume_unique=True)
+
+    # Лишние экземпляры: числящиеся на другой полке (misplaced) и не размещённые нигде (unexpected)
+    found_ids, shelf_ids = _locations(db, extra)
+    order = np.argsort(found_ids, kind="stable")
+    found_ids, shelf_ids = found_ids[order], shelf_ids[order]
+    unexpected = np.setdiff1d(extra, found_ids)
+
+    moved = 0
+    if fix and len(found_ids):
+        misplaced_ids = np.unique(found_ids)
+        for start in range(0, len(misplaced_ids), LOOKUP_CHUNK):
+            result = db.execute(
+                update(BookLocation)
+                .where(id_filter(db, BookLocation.copy_id, misplaced_ids[start:start + LOOKUP_CHUNK].tolist()))
+                .values(shelf_id=scope_id),
+                execution_options={"synchronize_session": False},
+            )
+            moved += result.rowcount
+        db.commit()
+
+    return {
+        "scope": scope.value,
+        "scope_id": scope_id,
+        "expected": int(len(expected)),
+        "scanned": int(len(scanned)),
+        "found": int(len(expected) - len(missing)),
+        "missing": missing.tolist(),
+        "misplaced": [
+            {"copy_id": copy_id, "shelf_id": shelf_id}
+            for copy_id, shelf_id in zip(found_ids.tolist(), shelf_ids.tolist())
+        ],
+        "unexpected": unexpected.tolist(),
+        "moved": moved,
+    }
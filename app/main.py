@@ -1,28 +1,76 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from app import auth, autocomplete, media, metrics, report_jobs
+from app.invalidation import bus
+from app.admission import AdmissionMiddleware
+from app.compression import CompressionMiddleware
+from app.idempotency import IdempotencyMiddleware
+from app.database import engine, replicas, SessionLocal, warm_pool
+from app.instrumentation import QueryStatsMiddleware, instrument_engine
+from app.replicas import ReadRoutingMiddleware
+from app.routers import autocomplete as autocomplete_router, batch, books, readers, fines, inventory, loans, logs, photos, reports
+
+# Таблицы создаются отдельной командой (python -m app.manage create-schema), а не при импорте
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(warm_pool, engine)
+    await run_in_threadpool(replicas.start)
+    bus.start()
+    await run_in_threadpool(autocomplete.start)
+    await run_in_threadpool(report_jobs.start)
+    await run_in_threadpool(media.start)
+    yield
+    await run_in_threadpool(bus.stop)
+    await run_in_threadpool(autocomplete.stop)
+    await run_in_threadpool(media.shutdown)
+    await run_in_threadpool(report_jobs.shutdown)
+    await run_in_threadpool(replicas.stop)
+    engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Повтор POST-запроса с тем же Idempotency-Key возвращает сохранённый ответ первого.
+# Подключается до сжатия, чтобы хранить ответы несжатыми
+app.add_middleware(IdempotencyMiddleware)
+
+# Сжатие ответов gzip/brotli по заголовку Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# GET-запросы читают с реплик (SQLALCHEMY_REPLICA_URIS), запись идёт в основную БД
+app.add_middleware(ReadRoutingMiddleware)
 
-from app import auth
-from app.models import Base
-from app.database import engine, SessionLocal
-from app.routers import books, readers, fines, loans
+# Подсчёт SQL-запросов и времени работы с БД для каждого запроса
+instrument_engine(engine)
+for replica_engine in replicas.engines:
+    instrument_engine(replica_engine)
+app.add_middleware(QueryStatsMiddleware)
 
-# Создание всех таблиц в базе данных
-Base.metadata.create_all(bind=engine)
+# Лимиты одновременных тяжёлых чтений, записей и входов; частота тяжёлых запросов по токену
+app.add_middleware(AdmissionMiddleware)
 
-app = FastAPI()
+# Метрики Prometheus: задержки по маршрутам, запросы в обработке, пул соединений
+metrics.register_pool_metrics(engine)
+metrics.register_replica_metrics(replicas)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Разрешенные источники для CORS (можно указать конкретные домены вместо "*")
 origins = [
     "*"
 ]
 
-# Middleware для обработки CORS-запросов
+# Middleware для обработки CORS-запросов. Подключается последним (внешним), чтобы заголовки CORS
+# получали и ответы 503/429 других middleware, а предварительные запросы не доходили до лимитов
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Query-Count", "X-Database-Route", "Retry-After"]
 )
 
 # Маршрут для проверки работы API
@@ -41,4 +89,24 @@ app.include_router(fines.router, prefix="/api", tags=["fines"])
 
 app.include_router(loans.router, prefix="/api", tags=["loans"])
 
-app.include_router(auth.router, tags=["auth"])
\ No newline at end of file
+# Подключение маршрутов для чтения журналов изменений
+app.include_router(logs.router, prefix="/api", tags=["logs"])
+
+# Подключение маршрута отчётов
+app.include_router(reports.router, prefix="/api", tags=["reports"])
+
+# Подключение маршрута для сверки инвентаризации
+app.include_router(inventory.router, prefix="/api", tags=["inventory"])
+
+# Подключение маршрута подсказок для строки поиска
+app.include_router(autocomplete_router.router, prefix="/api", tags=["autocomplete"])
+
+# Подключение маршрута для выдачи фотографий
+app.include_router(photos.router, prefix="/api", tags=["photos"])
+
+# Подключение маршрута пакетного выполнения запросов
+app.include_router(batch.router, prefix="/api", tags=["batch"])
+
+app.include_router(auth.router, tags=["auth"])
+
+app.include_router(metrics.router, tags=["metrics"])
\ No newline at end of file
@@ -0,0 +1,112 @@
+import argparse
+
+from sqlalchemy import text
+
+from app import idempotency, invalidation, migrations, popularity, recommendations
+from app.database import engine, SessionLocal
+from app.models import Base
+from app.partitions import ensure_log_partitions
+from app.retention import LOG_ARCHIVE_DIR, LOG_RETENTION_DAYS, archive_logs, restore_archive
+
+# Служебные команды: python -m app.manage <команда>
+
+SCHEMAS = ["library_schema", "db_logs", "employee_schema"]
+
+def create_schema(engine):
+    # Схемы и таблицы (вместе с секциями журналов) создаются один раз при развёртывании
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for schema in SCHEMAS:
+                conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+    Base.metadata.create_all(bind=engine)
+
+def create_tables(args):
+    create_schema(engine)
+    print("Database schema is up to date")
+
+def migrate(args):
+    applied = migrations.migrate(engine)
+    for name in applied:
+        print(f"Applied: {name}")
+    print(f"Migrations applied: {len(applied)}")
+
+def create_partitions(args):
+    with engine.begin() as conn:
+        created = ensure_log_partitions(conn, months_ahead=args.months_ahead)
+    print(f"Log partitions ensured: {len(created)}")
+
+def archive(args):
+    archived = archive_logs(engine, older_than_days=args.older_than_days, archive_dir=args.archive_dir)
+    for table, rows in archived.items():
+        print(f"{table}: archived {rows} rows")
+
+def restore(args):
+    for path in args.paths:
+        print(f"{path}: restored {restore_archive(engine, path)} rows")
+
+def rebuild_recommendations(args):
+    with SessionLocal() as db:
+        print(f"Book co-occurrence pairs: {recommendations.rebuild(db)}")
+
+def backfill_popularity(args):
+    with SessionLocal() as db:
+        print(f"Books with loan counters: {popularity.backfill(db)}")
+
+def purge_idempotency_keys(args):
+    print(f"Expired idempotency keys removed: {idempotency.purge_expired()}")
+
+def invalidate_cache(args):
+    # Например, после смены пароля сотрудника прямым SQL: invalidate-cache employee_credentials
+    invalidation.publish_now({(args.table, args.id)})
+    print(f"Cache invalidated: {args.table}" + (f" #{args.id}" if args.id is not None else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    schema_parser = commands.add_parser("create-schema", help="Create database schemas and tables")
+    schema_parser.set_defaults(handler=create_tables)
+
+    migrate_parser = commands.add_parser("migrate", help="Apply changes to existing tables that create-schema does not make")
+    migrate_parser.set_defaults(handler=migrate)
+
+    partitions_parser = commands.add_parser("create-partitions", help="Create monthly partitions for db_logs tables")
+    partitions_parser.add_argument("--months-ahead", type=int, default=3)
+    partitions_parser.set_defaults(handler=create_partitions)
+
+    archive_parser = commands.add_parser("archive-logs", help="Move old db_logs rows into gzip NDJSON archives")
+    archive_parser.add_argument("--older-than-days", type=int, default=LOG_RETENTION_DAYS)
+    archive_parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR)
+    archive_parser.set_defaults(handler=archive)
+
+    restore_parser = commands.add_parser("restore-logs", help="Load archived db_logs rows back into the database")
+    restore_parser.add_argument("paths", nargs="+")
+    restore_parser.set_defaults(handler=restore)
+
+    recommendations_parser = commands.add_parser(
+        "rebuild-recommendations", help="Rebuild the book co-occurrence index from loan history",
+    )
+    recommendations_parser.set_defaults(handler=rebuild_recommendations)
+
+    popularity_parser = commands.add_parser(
+        "backfill-popularity", help="Recalculate loan counters for popularity rankings from the loans table",
+    )
+    popularity_parser.set_defaults(handler=backfill_popularity)
+
+    idempotency_parser = commands.add_parser(
+        "purge-idempotency-keys", help="Remove stored responses whose Idempotency-Key has expired",
+    )
+    idempotency_parser.set_defaults(handler=purge_idempotency_keys)
+
+    invalidate_parser = commands.add_parser(
+        "invalidate-cache", help="Clear worker caches that depend on a table changed outside the application",
+    )
+    invalidate_parser.add_argument("table", choices=sorted(table.name for table in Base.metadata.tables.values()))
+    invalidate_parser.add_argument("--id", type=int)
+    invalidate_parser.set_defaults(handler=invalidate_cache)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+# Фотографии хранятся под именем <sha256>.<расширение>: повторная загрузка того же файла
+# не создаёт копию, а имя можно кэшировать без ограничения срока
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+MAX_PHOTO_SIZE = int(os.getenv("MAX_PHOTO_SIZE", str(20 * 1024 * 1024)))
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,512").split(","))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Миниатюры создаются только при установленном Pillow
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# Сигнатуры поддерживаемых форматов: тип определяется по содержимому, а не по заголовку клиента
+SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+# Сколько первых байт нужно для определения формата
+SIGNATURE_SIZE = 12
+# Заголовки частей и граница multipart сверх размера самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Описание тела загрузки для OpenAPI: маршруты читают поток сами и не объявляют параметр File
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"photo": {"type": "string", "format": "binary"}},
+            "required": ["photo"],
+        }}},
+    },
+}
+
+PHOTO_NAME = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp)$")
+
+logger = logging.getLogger(__name__)
+
+def detect_extension(head: bytes):
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+def original_path(name: str) -> str:
+    return os.path.join(MEDIA_DIR, "originals", name[:2], name)
+
+def thumbnail_path(name: str, size: int) -> str:
+    digest = os.path.splitext(name)[0]
+    return os.path.join(MEDIA_DIR, "thumbnails", str(size), digest[:2], f"{digest}.jpg")
+
+def photo_url(name, size: int | None = None):
+    # Ссылка на маршрут /api/photos; старые значения (произвольные пути) возвращаются как есть
+    if not name or not PHOTO_NAME.match(name):
+        return name
+    return f"/api/photos/{name}" + (f"?size={size}" if size is not None else "")
+
+def check_thumbnail_size(size: int | None):
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Thumbnail size must be one of {list(THUMBNAIL_SIZES)}")
+
+def with_thumbnails(rows, size: int | None):
+    # Поле photo строк списка заменяется ссылкой на миниатюру заданного размера
+    if size is not None:
+        check_thumbnail_size(size)
+        if rows and "photo" not in rows[0]:
+            return rows
+        for row in rows:
+            row["photo"] = photo_url(row["photo"], size)
+    return rows
+
+class PhotoWriter:
+    # Файл пишется во временный каталог по мере поступления с одновременным подсчётом хэша и размера;
+    # формат определяется по первым байтам. Целиком в памяти файл не держится
+    def __init__(self):
+        tmp_dir = os.path.join(MEDIA_DIR, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self.output = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.extension = None
+        self.head = b""
+        self.size = 0
+
+    def _append(self, chunk: bytes):
+        self.digest.update(chunk)
+        self.output.write(chunk)
+
+    def _detect(self):
+        self.extension = detect_extension(self.head)
+        if self.extension is None:
+            raise HTTPException(status_code=415, detail="Unsupported image format")
+        self._append(self.head)
+        self.head = b""
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > MAX_PHOTO_SIZE:
+            raise HTTPException(status_code=413, detail="Photo is too large")
+        if self.extension is not None:
+            self._append(chunk)
+            return
+        self.head += chunk
+        if len(self.head) >= SIGNATURE_SIZE:
+            self._detect()
+
+    def commit(self) -> str:
+        if self.extension is None:
+            if not self.head:
+                raise HTTPException(status_code=400, detail="Empty file")
+            self._detect()
+        self.output.close()
+
+        name = self.digest.hexdigest() + self.extension
+        path = original_path(name)
+        if os.path.exists(path):
+            os.remove(self.tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp_path, path)
+        return name
+
+    def discard(self):
+        self.output.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class _PhotoPart:
+    # Обработчики событий MultipartParser: данные части с нужным именем поля
+    # накапливаются в pending до следующей порции тела запроса
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.current = False
+        self.found = False
+        self.pending = []
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data, start, end):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        self.current = not self.found and options.get(b"name") == self.field
+
+    def on_part_data(self, data, start, end):
+        if self.current:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        if self.current:
+            self.found = True
+            self.current = False
+
+def check_upload(request: Request, field: str = "photo") -> bytes:
+    # Проверка заголовков до обращения к БД и чтения тела; возвращает границу частей
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail=f"Expected multipart/form-data with a '{field}' file")
+    try:
+        content_length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        content_length = 0
+    if content_length > MAX_PHOTO_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail="Photo is too large")
+    return options[b"boundary"]
+
+async def receive_upload(request: Request, field: str = "photo") -> str:
+    # multipart/form-data разбирается по мере чтения тела: файл не буферизуется парсером Starlette,
+    # а приём прекращается, как только размер превысил MAX_PHOTO_SIZE
+    part = _PhotoPart(field)
+    parser = MultipartParser(check_upload(request, field), part.callbacks())
+    writer = await run_in_threadpool(PhotoWriter)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if part.pending:
+                data, part.pending = b"".join(part.pending), []
+                await run_in_threadpool(writer.write, data)
+            if part.found:
+                break
+        if not part.found:
+            raise HTTPException(status_code=400, detail=f"Missing '{field}' file")
+        return await run_in_threadpool(writer.commit)
+    except BaseException:
+        await run_in_threadpool(writer.discard)
+        raise
+
+def generate_thumbnails(source: str, targets):
+    # Выполняется в отдельном процессе
+    from PIL import Image
+
+    created = []
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for size, target in targets:
+            if os.path.exists(target):
+                continue
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            thumbnail.save(tmp_path, "JPEG", quality=85, optimize=True)
+            os.replace(tmp_path, target)
+            created.append(target)
+    return created
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Thumbnail generation failed: %s", future.exception())
+
+def start():
+    # Пул создаётся при запуске воркера через forkserver (или spawn): fork процесса
+    # с работающими фоновыми потоками может унаследовать захваченные ими блокировки
+    global _executor
+    if not PILLOW_AVAILABLE:
+        logger.warning("Pillow is not installed: photo thumbnails are disabled, originals are served instead")
+        return
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=context)
+
+def schedule_thumbnails(name: str):
+    # Без пула (Pillow не установлен) отдаются оригиналы
+    targets = [(size, thumbnail_path(name, size)) for size in THUMBNAIL_SIZES]
+    if all(os.path.exists(target) for _, target in targets):
+        return None
+    with _executor_lock:
+        if _executor is None:
+            return None
+        future = _executor.submit(generate_thumbnails, original_path(name), targets)
+    future.add_done_callback(_log_failure)
+    return future
+
+def find_owner(db, model, key, detail: str):
+    # Проверка записи до приёма файла. Транзакция сразу завершается: соединение возвращается в пул
+    # и не занято, пока клиент передаёт тело
+    try:
+        if db.get(model, key) is None:
+            raise HTTPException(status_code=404, detail=detail)
+    finally:
+        db.rollback()
+
+def attach_photo(db, model, key, name: str, detail: str):
+    # Запись могла быть удалена, пока принимался файл; сам файл остаётся для повторной загрузки
+    instance = db.get(model, key)
+    if instance is None:
+        raise HTTPException(status_code=404, detail=detail)
+    instance.photo = name
+    db.commit()
+    schedule_thumbnails(name)
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,189 @@
+import threading
+import time
+from bisect import bisect_left
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.instrumentation import route_path
+
+router = APIRouter()
+
+# Метрики в текстовом формате Prometheus. Каждый поток пишет в собственную копию значений
+# без блокировок; при чтении /metrics копии суммируются
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _collect(self) -> dict:
+        # dict.copy() выполняется атомарно, поэтому чтение не мешает записи
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            for labels, value in shard.copy().items():
+                totals[labels] = self._merge(totals.get(labels), value)
+        return totals
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+    def samples(self):
+        for labels, value in sorted(self._collect().items()):
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, labels=(), amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, labels=(), amount: float = 1):
+        self.inc(labels, -amount)
+
+class Histogram(_Metric):
+    type_name = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, labels, value: float):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # Счётчики корзин, затем сумма и количество наблюдений
+            counts = shard[labels] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def _merge(self, total, value):
+        value = list(value)
+        return value if total is None else [a + b for a, b in zip(total, value)]
+
+    def samples(self):
+        for labels, counts in sorted(self._collect().items()):
+            label_values = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**label_values, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", label_values, counts[-2]
+            yield f"{self.name}_count", label_values, counts[-1]
+
+class CallbackGauge(_Metric):
+    # Значение вычисляется в момент чтения /metrics
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback):
+        self.callback = callback
+        super().__init__(name, documentation)
+
+    def samples(self):
+        value = self.callback()
+        if value is not None:
+            yield self.name, {}, value
+
+REGISTRY = []
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for name, labels, value in metric.samples():
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"),
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed", ("method",),
+)
+auth_attempts = Counter(
+    "auth_attempts_total", "Authentication attempts", ("kind", "result"),
+)
+
+def register_pool_metrics(engine):
+    pool = engine.pool
+    for name, documentation, attribute in [
+        ("db_pool_size", "Configured size of the database connection pool", "size"),
+        ("db_pool_checked_out", "Database connections currently in use", "checkedout"),
+        ("db_pool_checked_in", "Idle database connections in the pool", "checkedin"),
+        ("db_pool_overflow", "Database connections opened above the pool size", "overflow"),
+    ]:
+        if hasattr(pool, attribute):
+            CallbackGauge(name, documentation, getattr(pool, attribute))
+
+def register_replica_metrics(replicas):
+    if replicas.engines:
+        CallbackGauge("db_replicas_configured", "Configured read replicas", lambda: len(replicas.engines))
+        CallbackGauge("db_replicas_healthy", "Read replicas that passed the last health check", replicas.healthy_count)
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc((method,))
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec((method,))
+            http_request_duration.observe(
+                (method, route_path(scope), str(status_code)), time.perf_counter() - started,
+            )
+
+# Маршрут для сбора метрик Prometheus
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
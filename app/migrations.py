@@ -0,0 +1,94 @@
+from sqlalchemy import text
+
+from app.models import UserCard
+from app.partitions import LOG_TABLES, create_month_partition
+
+# Изменения существующей базы, которые create_all не выполняет (он только создаёт недостающие таблицы).
+# Каждый шаг сам проверяет состояние базы, поэтому команду migrate можно запускать повторно
+
+def user_cards_loan_id_nullable(connection):
+    # Новые читатели регистрируются без выдачи
+    if connection.dialect.name != "postgresql":
+        return False
+    table = UserCard.__table__
+    nullable = connection.scalar(
+        text(
+            "SELECT is_nullable = 'YES' FROM information_schema.columns "
+            "WHERE table_schema = :schema AND table_name = :table AND column_name = 'loan_id'"
+        ),
+        {"schema": table.schema, "table": table.name},
+    )
+    if nullable is None or nullable:
+        return False
+    connection.execute(text(f"ALTER TABLE {table.schema}.{table.name} ALTER COLUMN loan_id DROP NOT NULL"))
+    return True
+
+def _convert_log_table(connection, table):
+    # Обычная таблица переименовывается вместе с индексами и последовательностью ID, на её месте
+    # создаётся секционированная (с секцией по умолчанию и ближайшими месяцами), добавляются секции
+    # для всех месяцев с данными, строки переносятся, а старая таблица удаляется.
+    # Таблица заблокирована на время переноса, поэтому шаг стоит выполнять в окно обслуживания
+    qualified = f"{table.schema}.{table.name}"
+    legacy = f"{table.name}_legacy"
+    id_column = next(column for column in table.primary_key.columns if column.autoincrement is True)
+    sequence = connection.scalar(
+        text("SELECT pg_get_serial_sequence(:table, :column)"), {"table": qualified, "column": id_column.name},
+    )
+    indexes = connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table"),
+        {"schema": table.schema, "table": table.name},
+    ).scalars().all()
+
+    connection.execute(text(f"ALTER TABLE {qualified} RENAME TO {legacy}"))
+    for index in indexes:
+        connection.execute(text(f'ALTER INDEX {table.schema}."{index}" RENAME TO "{index}_legacy"'))
+    if sequence is not None:
+        sequence_name = sequence.split(".")[-1].strip('"')
+        connection.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO \"{sequence_name}_legacy\""))
+
+    table.create(connection)
+    months = connection.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {table.c.change_time.name})::date FROM {table.schema}.{legacy}"
+    )).scalars()
+    for month in months:
+        create_month_partition(connection, table, month)
+
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(text(f"INSERT INTO {qualified} ({columns}) SELECT {columns} FROM {table.schema}.{legacy}"))
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{qualified}', '{id_column.name}'), "
+        f"COALESCE((SELECT max({id_column.name}) FROM {qualified}), 0) + 1, false)"
+    ))
+    connection.execute(text(f"DROP TABLE {table.schema}.{legacy}"))
+
+def partition_log_tables(connection):
+    # Журналы существующих баз создавались обычными таблицами; create_all их не пересоздаёт
+    if connection.dialect.name != "postgresql":
+        return False
+    converted = False
+    for table in LOG_TABLES:
+        kind = connection.scalar(
+            text(
+                "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relname = :table"
+            ),
+            {"schema": table.schema, "table": table.name},
+        )
+        if kind == "r":
+            _convert_log_table(connection, table)
+            converted = True
+    return converted
+
+MIGRATIONS = [
+    ("user-cards-loan-id-nullable", user_cards_loan_id_nullable),
+    ("partition-log-tables", partition_log_tables),
+]
+
+def migrate(engine):
+    # Каждый шаг выполняется в своей транзакции; возвращаются имена применённых шагов
+    applied = []
+    for name, step in MIGRATIONS:
+        with engine.begin() as connection:
+            if step(connection):
+                applied.append(name)
+    return applied
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Date, Boolean, ForeignKey, CheckConstraint, UniqueConstraint, \
-    Numeric, TIMESTAMP, func
+from sqlalchemy import BigInteger, Column, Integer, String, Text, Date, Boolean, ForeignKey, CheckConstraint, UniqueConstraint, \
+    Numeric, TIMESTAMP, Index, LargeBinary, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -173,7 +173,7 @@ class Loan(Base):
     loan_date = Column(Date, nullable=False, server_default=func.current_date())
     due_date = Column(Date, nullable=False)
     return_date = Column(Date)
-    copy_id = Column(Integer, ForeignKey('library_schema.book_copies.book_id'), nullable=False)
+    copy_id = Column(Integer, ForeignKey('library_schema.book_copies.copy_id'), nullable=False)
 
     copy = relationship('BookCopy', back_populates='loans')
 
@@ -202,7 +202,8 @@ class UserCard(Base):
     status = Column(String, nullable=False)
     photo = Column(String(255))
     registration_date = Column(Date, nullable=False, server_default=func.current_date())
-    loan_id = Column(Integer, ForeignKey('library_schema.loans.loan_id'), nullable=False)
+    # У только что зарегистрированного читателя выдач ещё нет
+    loan_id = Column(Integer, ForeignKey('library_schema.loans.loan_id'))
 
     loan = relationship('Loan', back_populates='user_cards')
 
@@ -239,56 +240,128 @@ class FineCard(Base):
 Fine.fines_cards = relationship('FineCard', order_by=FineCard.fine_id, back_populates='fine', cascade='all, delete-orphan')
 UserCard.fines_cards = relationship('FineCard', order_by=FineCard.user_id, back_populates='user')
 
+# Сколько разных читателей брали обе книги; строится app/recommendations.py
+class BookCooccurrence(Base):
+    __tablename__ = 'book_cooccurrence'
+    __table_args__ = (
+        Index('ix_book_cooccurrence_book_id_readers', 'book_id', 'readers'),
+        {'schema': 'library_schema'},
+    )
+    book_id = Column(Integer, ForeignKey('library_schema.books.book_id', ondelete='CASCADE'), primary_key=True)
+    other_book_id = Column(Integer, ForeignKey('library_schema.books.book_id', ondelete='CASCADE'), primary_key=True)
+    readers = Column(Integer, nullable=False)
+
+# Читатель каждой выдачи — для рекомендаций и отчётов. Дополняется при выдаче и из db_logs.card_logs,
+# но в отличие от журнала не архивируется, поэтому история не теряется после LOG_RETENTION_DAYS
+class ReaderLoan(Base):
+    __tablename__ = 'reader_loans'
+    __table_args__ = (
+        Index('ix_reader_loans_user_id', 'user_id'),
+        {'schema': 'library_schema'},
+    )
+    loan_id = Column(Integer, ForeignKey('library_schema.loans.loan_id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('library_schema.user_cards.user_id', ondelete='CASCADE'), nullable=False)
+
+# Счётчики выдач для рейтингов популярности (app/popularity.py): по дням и за всё время
+class LoanDailyCount(Base):
+    __tablename__ = 'loan_daily_counts'
+    __table_args__ = (
+        {'schema': 'library_schema'},
+    )
+    day = Column(Date, primary_key=True)
+    book_id = Column(Integer, ForeignKey('library_schema.books.book_id', ondelete='CASCADE'), primary_key=True)
+    loans = Column(Integer, nullable=False)
+
+class BookLoanTotal(Base):
+    __tablename__ = 'book_loan_totals'
+    __table_args__ = (
+        Index('ix_book_loan_totals_loans', 'loans'),
+        {'schema': 'library_schema'},
+    )
+    book_id = Column(Integer, ForeignKey('library_schema.books.book_id', ondelete='CASCADE'), primary_key=True)
+    loans = Column(Integer, nullable=False)
+
+# Скользящие суммы выдач за последние days дней (неделя, месяц). Окно начинается с popularity_windows.since:
+# выдача прибавляет 1, а при сдвиге окна вычитаются счётчики выпавших дней из loan_daily_counts
+class BookPeriodLoanTotal(Base):
+    __tablename__ = 'book_period_loan_totals'
+    __table_args__ = (
+        Index('ix_book_period_loan_totals_days_loans', 'days', 'loans'),
+        {'schema': 'library_schema'},
+    )
+    days = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey('library_schema.books.book_id', ondelete='CASCADE'), primary_key=True)
+    loans = Column(Integer, nullable=False)
+
+class PopularityWindow(Base):
+    __tablename__ = 'popularity_windows'
+    __table_args__ = (
+        {'schema': 'library_schema'},
+    )
+    days = Column(Integer, primary_key=True)
+    since = Column(Date, nullable=False)
+
+# Журналы секционированы по месяцам (RANGE по change_time), поэтому change_time входит в первичный ключ.
+# Секции создаются в app/partitions.py
+
 class CardLog(Base):
     __tablename__ = 'card_logs'
     __table_args__ = (
-        {'schema': 'db_logs'},
+        Index('ix_card_logs_change_time_brin', 'change_time', postgresql_using='brin'),
+        Index('ix_card_logs_card_id_change_time', 'card_id', 'change_time'),
+        {'schema': 'db_logs', 'postgresql_partition_by': 'RANGE (change_time)'},
     )
-    card_log_id = Column(Integer, primary_key=True)
+    card_log_id = Column(Integer, primary_key=True, autoincrement=True)
     card_id = Column(Integer, nullable=False)
     table_field = Column(String, nullable=False)
     operation_type = Column(String, nullable=False)
     prev_value = Column(String, nullable=False)
     new_value = Column(String, nullable=False)
-    change_time = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    change_time = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.now())
 
 class BookLog(Base):
     __tablename__ = 'book_logs'
     __table_args__ = (
-        {'schema': 'db_logs'},
+        Index('ix_book_logs_change_time_brin', 'change_time', postgresql_using='brin'),
+        Index('ix_book_logs_book_id_change_time', 'book_id', 'change_time'),
+        {'schema': 'db_logs', 'postgresql_partition_by': 'RANGE (change_time)'},
     )
-    book_log_id = Column(Integer, primary_key=True)
+    book_log_id = Column(Integer, primary_key=True, autoincrement=True)
     book_id = Column(Integer, nullable=False)
     table_field = Column(String, nullable=False)
     operation_type = Column(String, nullable=False)
     prev_value = Column(String, nullable=False)
-    change_time = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    change_time = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.now())
 
 class FineLog(Base):
     __tablename__ = 'fine_logs'
     __table_args__ = (
-        {'schema': 'db_logs'},
+        Index('ix_fine_logs_change_time_brin', 'change_time', postgresql_using='brin'),
+        Index('ix_fine_logs_fine_id_change_time', 'fine_id', 'change_time'),
+        {'schema': 'db_logs', 'postgresql_partition_by': 'RANGE (change_time)'},
     )
-    fine_log_id = Column(Integer, primary_key=True)
+    fine_log_id = Column(Integer, primary_key=True, autoincrement=True)
     fine_id = Column(Integer, nullable=False)
     table_field = Column(String, nullable=False)
     operation_type = Column(String, nullable=False)
     prev_value = Column(String, nullable=False)
     new_value = Column(String, nullable=False)
-    change_time = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    change_time = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.now())
 
 class OverallLog(Base):
     __tablename__ = 'overall_logs'
     __table_args__ = (
-        {'schema': 'db_logs'},
+        Index('ix_overall_logs_change_time_brin', 'change_time', postgresql_using='brin'),
+        Index('ix_overall_logs_table_name_change_time', 'table_name', 'change_time'),
+        {'schema': 'db_logs', 'postgresql_partition_by': 'RANGE (change_time)'},
     )
-    overall_log_id = Column(Integer, primary_key=True)
+    overall_log_id = Column(Integer, primary_key=True, autoincrement=True)
     table_name = Column(String, nullable=False)
     table_field = Column(String, nullable=False)
     operation_type = Column(String, nullable=False)
     prev_value = Column(String, nullable=False)
     new_value = Column(String, nullable=False)
-    change_time = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    change_time = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.now())
 
 class Employee(Base):
     __tablename__ = 'employees'
@@ -322,4 +395,49 @@ class EmployeeCredential(Base):
 
     employee = relationship('Employee', back_populates='employee_credentials')
 
-Employee.employee_credentials = relationship('EmployeeCredential', order_by=EmployeeCredential.credential_id, back_populates='employee')
\ No newline at end of file
+Employee.employee_credentials = relationship('EmployeeCredential', order_by=EmployeeCredential.credential_id, back_populates='employee')
+
+# Фоновые задания построения отчётов (app/report_jobs.py); файл результата хранится в REPORTS_DIR
+class ReportJob(Base):
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        CheckConstraint("status IN ('queued', 'running', 'done', 'failed')"),
+        {'schema': 'library_schema'},
+    )
+    job_id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    format = Column(String(10), nullable=False)
+    params = Column(Text, nullable=False)
+    status = Column(String(10), nullable=False, default='queued')
+    created_by = Column(String(100), nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    started_at = Column(TIMESTAMP)
+    finished_at = Column(TIMESTAMP)
+    rows = Column(Integer)
+    file_name = Column(String(255))
+    error = Column(Text)
+
+# Результаты POST-запросов с заголовком Idempotency-Key (app/idempotency.py). Ключ — хэш токена
+# клиента и заголовка; строки удаляются после expires_at
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+        {'schema': 'library_schema'},
+    )
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    # Пока первый запрос выполняется, status_code пуст
+    status_code = Column(Integer)
+    content_type = Column(String(100))
+    body = Column(LargeBinary)
+    created_at = Column(TIMESTAMP, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False)
+
+# Версии таблиц для инвалидации кэшей (app.invalidation). Увеличиваются при каждой записи
+# и позволяют воркеру найти пропущенные уведомления после переподключения
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+    __table_args__ = {'schema': 'library_schema'}
+    entity = Column(String(100), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
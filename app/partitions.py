@@ -0,0 +1,99 @@
+from datetime import date
+
+from sqlalchemy import event, text
+
+from app.models import CardLog, BookLog, FineLog, OverallLog
+
+# Таблицы журналов, секционированные по месяцам
+LOG_TABLES = [
+    CardLog.__table__,
+    BookLog.__table__,
+    FineLog.__table__,
+    OverallLog.__table__,
+]
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table, month: date) -> str:
+    return f"{table.name}_y{month.year}m{month.month:02d}"
+
+def create_default_partition(conn, table):
+    # Секция по умолчанию принимает строки вне заранее созданных месяцев,
+    # чтобы вставка в журнал никогда не падала
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {table.schema}.{table.name}_default "
+        f"PARTITION OF {table.schema}.{table.name} DEFAULT"
+    ))
+
+def create_month_partition(conn, table, month: date) -> str:
+    name = partition_name(table, month)
+    parent = f"{table.schema}.{table.name}"
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": f"{table.schema}.{name}"}).scalar() is not None:
+        return name
+
+    # Строки этого месяца могли попасть в секцию по умолчанию (восстановление архива, поздний запуск cron):
+    # тогда новую секцию создать нельзя, поэтому строки переносятся в отдельную таблицу, которая затем
+    # подключается секцией. Блокировка не даёт добавить в секцию по умолчанию новые строки этого месяца
+    default = f"{parent}_default"
+    condition = f"change_time >= '{month.isoformat()}' AND change_time < '{add_months(month, 1).isoformat()}'"
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is not None
+    if has_default:
+        conn.execute(text(f"LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE"))
+    if not has_default or not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {condition})")).scalar():
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table.schema}.{name} PARTITION OF {parent} FOR VALUES {bounds}"))
+        return name
+
+    conn.execute(text(f"CREATE TABLE {table.schema}.{name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {condition} RETURNING *) "
+        f"INSERT INTO {table.schema}.{name} SELECT * FROM moved"
+    ))
+    conn.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {table.schema}.{name} FOR VALUES {bounds}"))
+    return name
+
+def ensure_log_partitions(conn, start: date | None = None, months_ahead: int = 3):
+    # Создание секций на текущий и следующие месяцы (запускать по расписанию)
+    if conn.dialect.name != "postgresql":
+        return []
+
+    first_month = month_start(start or date.today())
+    created = []
+    for table in LOG_TABLES:
+        for offset in range(months_ahead + 1):
+            created.append(create_month_partition(conn, table, add_months(first_month, offset)))
+    return created
+
+def get_log_partitions(conn, table):
+    # Список месячных секций таблицы: [(имя секции, первый день месяца), ...]
+    rows = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_namespace ns ON ns.oid = parent.relnamespace "
+        "WHERE ns.nspname = :schema AND parent.relname = :table"
+    ), {"schema": table.schema, "table": table.name}).scalars()
+
+    partitions = []
+    prefix = f"{table.name}_y"
+    for name in rows:
+        if not name.startswith(prefix):
+            continue
+        year, month = name[len(prefix):].split("m")
+        partitions.append((name, date(int(year), int(month), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def _create_initial_partitions(table, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        return
+    create_default_partition(connection, table)
+    for offset in range(4):
+        create_month_partition(connection, table, add_months(month_start(date.today()), offset))
+
+for log_table in LOG_TABLES:
+    event.listen(log_table, "after_create", _create_initial_partitions)
@@ -0,0 +1,161 @@
+import os
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.cache import LocalCache
+from app.database import engine
+from app.models import (
+    Book, BookCopy, BookLoanTotal, BookPeriodLoanTotal, Category, Genre, Loan, LoanDailyCount, PopularityWindow,
+)
+from app.schemas import PopularityPeriod
+
+load_dotenv()
+
+# Рейтинги «чаще всего берут» считаются по счётчикам выдач, а не по таблице loans.
+# Счётчики увеличиваются в транзакции выдачи; суммы за неделю и месяц хранятся готовыми
+# (book_period_loan_totals) и раз в день сдвигаются вычитанием выпавших дней, поэтому рейтинг
+# не суммирует loan_daily_counts при каждом запросе. Готовые списки кэшируются на POPULARITY_TTL секунд
+POPULARITY_TTL = float(os.getenv("POPULARITY_TTL", "60"))
+
+PERIOD_DAYS = {PopularityPeriod.week: 7, PopularityPeriod.month: 30}
+
+popular_cache = LocalCache("popular_books", maxsize=1024, ttl=POPULARITY_TTL)
+
+# День, на который окна уже сдвинуты этим воркером
+_rolled_on = None
+
+def _insert(bind, model):
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model.__table__)
+
+def _window_start(days: int, today: date) -> date:
+    return today - timedelta(days=days - 1)
+
+def record_loan(db: Session, book_id: int, day: date):
+    counters = [
+        (LoanDailyCount, {"day": day, "book_id": book_id, "loans": 1}, ["day", "book_id"]),
+        (BookLoanTotal, {"book_id": book_id, "loans": 1}, ["book_id"]),
+    ]
+    today = date.today()
+    for days in PERIOD_DAYS.values():
+        if day >= _window_start(days, today):
+            counters.append(
+                (BookPeriodLoanTotal, {"days": days, "book_id": book_id, "loans": 1}, ["days", "book_id"]),
+            )
+    for model, values, keys in counters:
+        statement = _insert(db.get_bind(), model).values(values)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=keys, set_={"loans": model.__table__.c.loans + 1},
+        ))
+
+def _fill_window(connection, days: int, since: date):
+    # Первое заполнение окна (после развёртывания или backfill) из дневных счётчиков
+    created = connection.execute(
+        _insert(connection, PopularityWindow).values(days=days, since=since).on_conflict_do_nothing()
+    ).rowcount
+    if not created:
+        return
+    connection.execute(delete(BookPeriodLoanTotal).where(BookPeriodLoanTotal.days == days))
+    counts = (
+        select(literal(days), LoanDailyCount.book_id, func.sum(LoanDailyCount.loans))
+        .where(LoanDailyCount.day >= since)
+        .group_by(LoanDailyCount.book_id)
+    )
+    connection.execute(insert(BookPeriodLoanTotal).from_select(["days", "book_id", "loans"], counts))
+
+def roll_windows(connection, today: date):
+    # Условный UPDATE начала окна работает как compare-and-set: из воркеров, одновременно
+    # сдвигающих окно, выпавшие дни вычитает только один
+    table = BookPeriodLoanTotal.__table__
+    for days in PERIOD_DAYS.values():
+        since = _window_start(days, today)
+        current = connection.scalar(select(PopularityWindow.since).where(PopularityWindow.days == days))
+        if current is None:
+            _fill_window(connection, days, since)
+            continue
+        if current >= since:
+            continue
+        moved = connection.execute(
+            update(PopularityWindow)
+            .where(PopularityWindow.days == days, PopularityWindow.since == current)
+            .values(since=since)
+        ).rowcount
+        if not moved:
+            continue
+        expired = (
+            select(LoanDailyCount.book_id, func.sum(LoanDailyCount.loans).label("loans"))
+            .where(LoanDailyCount.day >= current, LoanDailyCount.day < since)
+            .group_by(LoanDailyCount.book_id)
+            .subquery()
+        )
+        connection.execute(
+            update(table)
+            .where(table.c.days == days, table.c.book_id == expired.c.book_id)
+            .values(loans=table.c.loans - expired.c.loans)
+        )
+        connection.execute(delete(table).where(table.c.days == days, table.c.loans <= 0))
+
+def _roll_daily():
+    # Сдвиг выполняется в основной БД отдельной короткой транзакцией, не чаще раза в день на воркер
+    global _rolled_on
+    today = date.today()
+    if _rolled_on == today:
+        return
+    with engine.begin() as connection:
+        roll_windows(connection, today)
+    _rolled_on = today
+
+def get_popular(db: Session, period: PopularityPeriod, genre_id=None, category_id=None, limit: int = 10):
+    def load():
+        if period == PopularityPeriod.all:
+            counts = select(BookLoanTotal.book_id, BookLoanTotal.loans.label("loans")).subquery()
+        else:
+            _roll_daily()
+            counts = (
+                select(BookPeriodLoanTotal.book_id, BookPeriodLoanTotal.loans.label("loans"))
+                .where(BookPeriodLoanTotal.days == PERIOD_DAYS[period])
+                .subquery()
+            )
+
+        query = (
+            select(Book.book_id, Book.book_name, Genre.genre_name, Category.category_name, counts.c.loans)
+            .join(counts, counts.c.book_id == Book.book_id)
+            .join(Genre, Genre.genre_id == Book.genre_id)
+            .join(Category, Category.category_id == Book.category_id)
+        )
+        if genre_id is not None:
+            query = query.where(Book.genre_id == genre_id)
+        if category_id is not None:
+            query = query.where(Book.category_id == category_id)
+
+        rows = db.execute(query.order_by(counts.c.loans.desc(), Book.book_id).limit(limit)).all()
+        return [
+            {"book_id": row.book_id, "book_name": row.book_name, "genre": row.genre_name,
+             "category": row.category_name, "loans": int(row.loans)}
+            for row in rows
+        ]
+
+    return popular_cache.get_or_set((period, genre_id, category_id, limit), load)
+
+def backfill(db: Session) -> int:
+    # Пересчёт счётчиков по всей таблице loans (после миграции или восстановления из резервной копии)
+    db.execute(delete(LoanDailyCount))
+    db.execute(delete(BookLoanTotal))
+    db.execute(delete(BookPeriodLoanTotal))
+    db.execute(delete(PopularityWindow))
+    daily = (
+        select(Loan.loan_date, BookCopy.book_id, func.count())
+        .join(BookCopy, BookCopy.copy_id == Loan.copy_id)
+        .group_by(Loan.loan_date, BookCopy.book_id)
+    )
+    db.execute(insert(LoanDailyCount).from_select(["day", "book_id", "loans"], daily))
+    totals = select(LoanDailyCount.book_id, func.sum(LoanDailyCount.loans)).group_by(LoanDailyCount.book_id)
+    result = db.execute(insert(BookLoanTotal).from_select(["book_id", "loans"], totals))
+    roll_windows(db.connection(), date.today())
+    db.commit()
+    popular_cache.clear()
+    return result.rowcount
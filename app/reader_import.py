@@ -0,0 +1,163 @@
+import codecs
+import csv
+import io
+import os
+import re
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.crud import id_filter
+from app.invalidation import mark_changed
+from app.models import UserCard
+from app.schemas import ReaderImport, ReaderImportList
+
+load_dotenv()
+
+# Массовая регистрация читателей из CSV или JSON: строки проверяются пачками по IMPORT_BATCH_SIZE,
+# уникальность email и паспорта — одним запросом на пачку, загрузка в PostgreSQL — через COPY
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "100000"))
+
+# То же правило, что и ограничение user_cards в БД: одна неверная строка не должна срывать весь COPY
+EMAIL_PATTERN = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
+
+COLUMNS = list(ReaderImport.model_fields)
+
+def read_rows(upload: UploadFile):
+    # Формат определяется по типу или расширению файла; по умолчанию CSV с заголовком
+    is_json = upload.content_type == "application/json" or (upload.filename or "").lower().endswith(".json")
+    try:
+        if is_json:
+            rows = orjson.loads(upload.file.read())
+            if not isinstance(rows, list):
+                raise ValueError("JSON must be an array of objects")
+        else:
+            text = codecs.getreader("utf-8-sig")(upload.file)
+            # Пустые ячейки CSV считаются отсутствующими: для них действуют значения по умолчанию
+            rows = [
+                {key: value for key, value in row.items() if key is not None and value != ""}
+                for row in csv.DictReader(text)
+            ]
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot parse file: {e}")
+
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_IMPORT_ROWS} rows per import")
+    return rows
+
+def _format_error(error):
+    field = ".".join(str(part) for part in error["loc"][1:])
+    return f"{field}: {error['msg']}" if field else error["msg"]
+
+def validate_batch(rows, start: int, errors: dict):
+    # Пачка проверяется целиком; при ошибках повторно разбираются только строки без ошибок
+    try:
+        readers = ReaderImportList.validate_python(rows)
+        valid = list(zip(range(start, start + len(rows)), readers))
+    except ValidationError as e:
+        failed = set()
+        for error in e.errors():
+            index = error["loc"][0]
+            failed.add(index)
+            errors.setdefault(start + index, []).append(_format_error(error))
+        valid = [
+            (start + index, ReaderImport.model_validate(row))
+            for index, row in enumerate(rows) if index not in failed
+        ]
+
+    result = []
+    for row_number, reader in valid:
+        if not EMAIL_PATTERN.match(reader.user_email):
+            errors.setdefault(row_number, []).append("user_email: invalid email address")
+        else:
+            result.append((row_number, reader))
+    return result
+
+def check_unique(db: Session, readers, seen_emails: set, seen_passports: set, errors: dict):
+    emails = [reader.user_email for _, reader in readers]
+    passports = [(reader.user_passport_series, reader.user_passport_number) for _, reader in readers]
+    existing = db.execute(
+        select(UserCard.user_email, UserCard.user_passport_series, UserCard.user_passport_number)
+        .where(or_(
+            id_filter(db, UserCard.user_email, emails),
+            tuple_(UserCard.user_passport_series, UserCard.user_passport_number).in_(passports),
+        ))
+    ).all()
+    taken_emails = {row.user_email for row in existing}
+    taken_passports = {(row.user_passport_series, row.user_passport_number) for row in existing}
+
+    result = []
+    for row_number, reader in readers:
+        passport = (reader.user_passport_series, reader.user_passport_number)
+        row_errors = []
+        if reader.user_email in taken_emails:
+            row_errors.append("user_email: already registered")
+        elif reader.user_email in seen_emails:
+            row_errors.append("user_email: duplicated in file")
+        if passport in taken_passports:
+            row_errors.append("passport: already registered")
+        elif passport in seen_passports:
+            row_errors.append("passport: duplicated in file")
+
+        seen_emails.add(reader.user_email)
+        seen_passports.add(passport)
+        if row_errors:
+            errors.setdefault(row_number, []).extend(row_errors)
+        else:
+            result.append(reader.model_dump())
+    return result
+
+def _copy_value(value):
+    # NULL в формате CSV — пустое значение без кавычек, строки всегда в кавычках
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+def copy_rows(db: Session, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_value(row[column]) for column in COLUMNS))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    # Соединение сессии: COPY выполняется в её транзакции
+    connection = db.connection().connection.driver_connection
+    table = f"{UserCard.__table__.schema}.{UserCard.__tablename__}"
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def load_rows(db: Session, rows):
+    if db.get_bind().dialect.driver == "psycopg2":
+        copy_rows(db, rows)
+    else:
+        db.execute(insert(UserCard), rows)
+
+def import_readers(db: Session, rows):
+    errors = {}
+    seen_emails, seen_passports = set(), set()
+    imported = 0
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        readers = validate_batch(rows[start:start + IMPORT_BATCH_SIZE], start, errors)
+        if not readers:
+            continue
+        valid = check_unique(db, readers, seen_emails, seen_passports, errors)
+        if valid:
+            load_rows(db, valid)
+            imported += len(valid)
+
+    if imported:
+        # COPY и INSERT без ORM не видны событиям сессии
+        mark_changed(db, {(UserCard.__tablename__, None)})
+    db.commit()
+
+    return {
+        "imported": imported,
+        "errors": [{"row": row_number + 1, "errors": messages} for row_number, messages in sorted(errors.items())],
+    }
@@ -0,0 +1,129 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import Integer, and_, case, cast, delete, func, insert, select, true, union
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.cache import LocalCache
+from app.invalidation import mark_changed
+from app.models import Book, BookCooccurrence, BookCopy, CardLog, Loan, ReaderLoan, UserCard
+
+load_dotenv()
+
+# «Читатели, бравшие эту книгу, также брали»: для каждой пары книг хранится число разных
+# читателей, бравших обе. Таблица перестраивается целиком одним INSERT ... SELECT по reader_loans
+# (python -m app.manage rebuild-recommendations, раз в сутки) и дополняется при каждой выдаче
+RECOMMENDATIONS_LIMIT = int(os.getenv("RECOMMENDATIONS_LIMIT", "10"))
+
+TABLE = BookCooccurrence.__tablename__
+
+# Топ соседей книги: book_id -> [(other_book_id, book_name, readers)]
+neighbours_cache = LocalCache("book_neighbours", maxsize=8192)
+
+def _loan_id(value):
+    # Значения card_logs — произвольный текст: CAST выполняется только для чисел,
+    # CASE гарантирует, что проверка вычисляется раньше приведения
+    return case((value.regexp_match("^[0-9]{1,9}$"), cast(value, Integer)))
+
+def logged_loans():
+    # Выдачи, известные по user_cards.loan_id и истории изменений этого поля в card_logs
+    current = select(UserCard.user_id.label("user_id"), UserCard.loan_id.label("loan_id")).where(UserCard.loan_id != None)
+    history = [
+        select(CardLog.card_id.label("user_id"), _loan_id(value).label("loan_id"))
+        .where(CardLog.table_field == "loan_id")
+        for value in (CardLog.new_value, CardLog.prev_value)
+    ]
+    return union(current, *history)
+
+def sync_reader_loans(db: Session) -> int:
+    # Дописывает в reader_loans выдачи, которые ещё есть в user_cards и card_logs.
+    # Существующие строки не меняются, поэтому заархивированная часть журнала не теряется
+    loans = logged_loans().subquery()
+    query = (
+        select(loans.c.loan_id, func.min(loans.c.user_id))
+        .join(Loan, Loan.loan_id == loans.c.loan_id)
+        .join(UserCard, UserCard.user_id == loans.c.user_id)
+        # WHERE true снимает неоднозначность разбора INSERT ... SELECT ... ON CONFLICT в SQLite
+        .where(true())
+        .group_by(loans.c.loan_id)
+    )
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(ReaderLoan.__table__).from_select(["loan_id", "user_id"], query)
+    return db.execute(statement.on_conflict_do_nothing(index_elements=["loan_id"])).rowcount
+
+def reader_loans(user_id=None):
+    query = select(ReaderLoan.user_id, ReaderLoan.loan_id)
+    if user_id is not None:
+        query = query.where(ReaderLoan.user_id == user_id)
+    return query
+
+def reader_books(user_id=None):
+    loans = reader_loans(user_id).subquery()
+    return (
+        select(loans.c.user_id, BookCopy.book_id)
+        .join(Loan, Loan.loan_id == loans.c.loan_id)
+        .join(BookCopy, BookCopy.copy_id == Loan.copy_id)
+        .distinct()
+    )
+
+def rebuild(db: Session) -> int:
+    sync_reader_loans(db)
+    books = reader_books().cte("reader_books")
+    other = books.alias("other_books")
+    pairs = (
+        select(books.c.book_id, other.c.book_id, func.count())
+        .join(other, and_(other.c.user_id == books.c.user_id, other.c.book_id != books.c.book_id))
+        .group_by(books.c.book_id, other.c.book_id)
+    )
+
+    db.execute(delete(BookCooccurrence))
+    result = db.execute(
+        insert(BookCooccurrence).from_select(["book_id", "other_book_id", "readers"], pairs)
+    )
+    mark_changed(db, {(TABLE, None)})
+    db.commit()
+    return result.rowcount
+
+def _upsert(db: Session, rows):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    table = BookCooccurrence.__table__
+    statement = dialect.insert(table).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.book_id, table.c.other_book_id],
+        set_={"readers": table.c.readers + 1},
+    ))
+
+def record_loan(db: Session, user_id: int, book_id: int, loan_id: int):
+    # Новая книга образует пары со всеми книгами, которые читатель брал раньше.
+    # Повторная выдача той же книги счётчики не меняет
+    previous = set(db.execute(select(reader_books(user_id).subquery().c.book_id)).scalars())
+    db.add(ReaderLoan(loan_id=loan_id, user_id=user_id))
+    if book_id in previous or not previous:
+        return
+
+    # Одинаковый порядок строк во всех транзакциях исключает взаимные блокировки
+    rows = sorted(
+        [{"book_id": book_id, "other_book_id": other_id, "readers": 1} for other_id in previous]
+        + [{"book_id": other_id, "other_book_id": book_id, "readers": 1} for other_id in previous],
+        key=lambda row: (row["book_id"], row["other_book_id"]),
+    )
+    _upsert(db, rows)
+    mark_changed(db, {(TABLE, book_id)} | {(TABLE, other_id) for other_id in previous})
+
+def get_neighbours(db: Session, book_id: int, limit: int = RECOMMENDATIONS_LIMIT):
+    def load():
+        rows = db.execute(
+            select(BookCooccurrence.other_book_id, Book.book_name, BookCooccurrence.readers)
+            .join(Book, Book.book_id == BookCooccurrence.other_book_id)
+            .where(BookCooccurrence.book_id == book_id)
+            .order_by(BookCooccurrence.readers.desc(), BookCooccurrence.other_book_id)
+            .limit(RECOMMENDATIONS_LIMIT)
+        ).all()
+        return [tuple(row) for row in rows]
+
+    neighbours = neighbours_cache.get_or_set(book_id, load, tags=[(TABLE, book_id)])
+    return [
+        {"book_id": other_id, "book_name": name, "readers": readers}
+        for other_id, name, readers in neighbours[:limit]
+    ]
@@ -0,0 +1,165 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+from starlette.datastructures import Headers, MutableHeaders
+
+load_dotenv()
+
+# После записи клиент READ_YOUR_WRITES_SECONDS секунд читает с основной БД,
+# чтобы не увидеть устаревшие данные из реплики
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+READ_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "db_primary_until"
+
+logger = logging.getLogger(__name__)
+
+class DatabaseRoute:
+    __slots__ = ("read_only", "sticky", "wrote", "target")
+
+    def __init__(self, read_only: bool, sticky: bool = False, wrote: bool = False):
+        self.read_only = read_only
+        # Клиент в «липком» окне после своей записи
+        self.sticky = sticky
+        # Успешный ответ открывает «липкое» окно; обработчик может изменить это (см. /api/batch)
+        self.wrote = wrote
+        self.target = None
+
+# Маршрутизация текущего запроса. Объект изменяемый: сессия в пуле потоков
+# записывает в него, какая БД была использована
+db_route: ContextVar[DatabaseRoute | None] = ContextVar("db_route", default=None)
+
+class ReplicaSet:
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self.healthy = [True] * len(self.engines)
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+        for index, engine in enumerate(self.engines):
+            event.listen(engine, "handle_error", self._on_error(index))
+
+    def _on_error(self, index):
+        # Обрыв соединения выводит реплику из ротации до следующей успешной проверки
+        def handle_error(context):
+            if context.is_disconnect and self.healthy[index]:
+                self.healthy[index] = False
+                logger.warning("Replica %s disconnected, routing reads to other databases", index)
+        return handle_error
+
+    def choose(self):
+        # Круговой выбор среди доступных реплик; None, если доступных нет
+        for _ in range(len(self.engines)):
+            index = next(self._counter) % len(self.engines)
+            if self.healthy[index]:
+                return self.engines[index]
+        return None
+
+    def healthy_count(self) -> int:
+        return sum(self.healthy)
+
+    def check(self):
+        for index, engine in enumerate(self.engines):
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                healthy = True
+            except Exception as e:
+                healthy = False
+                if self.healthy[index]:
+                    logger.warning("Replica %s is not available: %s", index, e)
+            if healthy and not self.healthy[index]:
+                logger.info("Replica %s is available again", index)
+            self.healthy[index] = healthy
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def start(self, interval: float = REPLICA_CHECK_INTERVAL):
+        if not self.engines or self._thread is not None:
+            return
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        for engine in self.engines:
+            engine.dispose()
+
+def client_key(headers: Headers, scope) -> str:
+    # Клиент определяется по токену, а без него — по адресу
+    authorization = headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    client = scope.get("client")
+    return client[0] if client else ""
+
+class ReadRoutingMiddleware:
+    # GET и HEAD читают с реплик, остальные методы работают с основной БД. Время окончания
+    # «липкого» окна хранится в памяти процесса и в cookie, чтобы его видели и другие воркеры
+    def __init__(self, app, window: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+        self._primary_until = {}
+
+    def _sticky(self, key: str, headers: Headers) -> bool:
+        now = time.time()
+        if self._primary_until.get(key, 0) > now:
+            return True
+        cookie = SimpleCookie(headers.get("cookie", ""))
+        try:
+            return float(cookie[STICKY_COOKIE].value) > now
+        except (KeyError, ValueError):
+            return False
+
+    def _remember_write(self, key: str) -> float:
+        now = time.time()
+        if len(self._primary_until) > 10000:
+            self._primary_until = {k: v for k, v in self._primary_until.items() if v > now}
+        until = self._primary_until[key] = now + self.window
+        return until
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = client_key(headers, scope)
+        is_read = scope["method"] in READ_METHODS
+        sticky = self._sticky(key, headers)
+        route = DatabaseRoute(read_only=is_read and not sticky, sticky=sticky, wrote=not is_read)
+        token = db_route.set(route)
+
+        async def send_with_route(message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                if route.wrote and message["status"] < 400:
+                    until = self._remember_write(key)
+                    response_headers.append(
+                        "Set-Cookie",
+                        f"{STICKY_COOKIE}={until:.3f}; Max-Age={int(self.window) + 1}; Path=/; HttpOnly; SameSite=Lax",
+                    )
+                if route.target is not None:
+                    response_headers.append("X-Database-Route", route.target)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_route)
+        finally:
+            db_route.reset(token)
@@ -0,0 +1,252 @@
+import csv
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import islice
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine
+from app.models import Book, BookCopy, BookLocation, Genre, Loan, Rack, ReportJob, Section, Shelf, UserCard
+from app.recommendations import reader_loans
+from app.schemas import ReportFormat, ReportJobCreate, ReportKind
+
+load_dotenv()
+
+# Отчёты строятся в отдельном процессе: он читает агрегаты курсором на стороне сервера
+# и пишет файл в REPORTS_DIR частями, не занимая воркеры API. Состояние задания хранится в report_jobs
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "1"))
+REPORT_FETCH_SIZE = int(os.getenv("REPORT_FETCH_SIZE", "10000"))
+# Задание в статусе running дольше этого срока считается брошенным (процесс отчёта погиб вместе с воркером)
+REPORT_JOB_TIMEOUT = float(os.getenv("REPORT_JOB_TIMEOUT", "3600"))
+
+# Parquet доступен только при установленном pyarrow
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+MEDIA_TYPES = {ReportFormat.csv: "text/csv", ReportFormat.parquet: "application/vnd.apache.parquet"}
+
+logger = logging.getLogger(__name__)
+
+def circulation_query(date_from: date | None = None, date_to: date | None = None):
+    # Выдачи, возвраты и просрочки в разрезе раздела, жанра и статуса читателя.
+    # Невозвращённая книга считается просроченной, если срок прошёл к концу периода
+    as_of = min(date_to, date.today()) if date_to is not None else date.today()
+    readers = reader_loans().subquery()
+    overdue = case(
+        (or_(Loan.return_date > Loan.due_date, and_(Loan.return_date == None, Loan.due_date < as_of)), 1),
+        else_=0,
+    )
+    query = (
+        select(
+            func.coalesce(Section.section_name, "Не размещена").label("section"),
+            Genre.genre_name.label("genre"),
+            func.coalesce(UserCard.status, "Неизвестно").label("reader_status"),
+            func.count().label("loans"),
+            func.count(Loan.return_date).label("returns"),
+            func.sum(overdue).label("overdue"),
+        )
+        .select_from(Loan)
+        .join(BookCopy, BookCopy.copy_id == Loan.copy_id)
+        .join(Book, Book.book_id == BookCopy.book_id)
+        .join(Genre, Genre.genre_id == Book.genre_id)
+        .outerjoin(BookLocation, BookLocation.copy_id == Loan.copy_id)
+        .outerjoin(Shelf, Shelf.shelf_id == BookLocation.shelf_id)
+        .outerjoin(Rack, Rack.rack_id == Shelf.rack_id)
+        .outerjoin(Section, Section.section_id == Rack.section_id)
+        .outerjoin(readers, readers.c.loan_id == Loan.loan_id)
+        .outerjoin(UserCard, UserCard.user_id == readers.c.user_id)
+    )
+    if date_from is not None:
+        query = query.where(Loan.loan_date >= date_from)
+    if date_to is not None:
+        query = query.where(Loan.loan_date <= date_to)
+    group = (Section.section_name, Genre.genre_name, UserCard.status)
+    return query.group_by(*group).order_by(*group)
+
+def circulation_rows(result):
+    for row in result:
+        yield {
+            "section": row.section,
+            "genre": row.genre,
+            "reader_status": row.reader_status,
+            "loans": row.loans,
+            "returns": row.returns,
+            "overdue": row.overdue,
+            "overdue_ratio": round(row.overdue / row.loans, 4) if row.loans else 0.0,
+        }
+
+# Вид отчёта -> (запрос, преобразование строк, столбцы файла)
+REPORTS = {
+    ReportKind.circulation: (
+        circulation_query,
+        circulation_rows,
+        ["section", "genre", "reader_status", "loans", "returns", "overdue", "overdue_ratio"],
+    ),
+}
+
+def write_csv(rows, columns, path: str) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.DictWriter(output, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_parquet(rows, columns, path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Строки пишутся группами по REPORT_FETCH_SIZE; схема файла берётся из первой группы
+    rows = iter(rows)
+    count = 0
+    writer = None
+    try:
+        while batch := list(islice(rows, REPORT_FETCH_SIZE)):
+            table = pa.Table.from_pylist(batch, schema=writer.schema if writer else None)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            count += len(batch)
+        if writer is None:
+            pq.write_table(pa.table({column: [] for column in columns}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+WRITERS = {ReportFormat.csv: write_csv, ReportFormat.parquet: write_parquet}
+
+def file_path(job: ReportJob) -> str:
+    return os.path.join(REPORTS_DIR, job.file_name)
+
+def run_job(job_id: str):
+    # Выполняется в отдельном процессе; обычная сессия без маршрутизации и событий инвалидации.
+    # Задание выполняет только тот процесс, который первым перевёл его из queued (см. resume_jobs)
+    with Session(engine) as db:
+        claimed = db.execute(
+            update(ReportJob)
+            .where(ReportJob.job_id == job_id, ReportJob.status == "queued")
+            .values(status="running", started_at=func.now())
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return
+        job = db.get(ReportJob, job_id)
+
+        file_name = f"{job_id}.{job.format}"
+        tmp_path = os.path.join(REPORTS_DIR, f"{file_name}.tmp")
+        try:
+            report_format = ReportFormat(job.format)
+            query, convert, columns = REPORTS[ReportKind(job.kind)]
+            params = {key: date.fromisoformat(value) if value else None for key, value in json.loads(job.params).items()}
+            os.makedirs(REPORTS_DIR, exist_ok=True)
+
+            with engine.connect().execution_options(stream_results=True, yield_per=REPORT_FETCH_SIZE) as connection:
+                rows = WRITERS[report_format](convert(connection.execute(query(**params))), columns, tmp_path)
+            os.replace(tmp_path, os.path.join(REPORTS_DIR, file_name))
+
+            job.status, job.rows, job.file_name = "done", rows, file_name
+        except Exception as e:
+            logger.exception("Report job %s failed", job_id)
+            db.rollback()
+            job.status, job.error = "failed", str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        job.finished_at = func.now()
+        db.commit()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _mark_failed(job_id: str, future):
+    # Задание отменено при остановке воркера или процесс отчёта завершился аварийно, не записав статус
+    if future.cancelled():
+        error = "Cancelled: the API worker was shut down"
+    elif future.exception() is not None:
+        error = str(future.exception())
+        logger.warning("Report job %s crashed: %s", job_id, error)
+    else:
+        return
+    with SessionLocal() as db:
+        job = db.get(ReportJob, job_id)
+        if job is not None and job.status in ("queued", "running"):
+            job.status, job.error, job.finished_at = "failed", error, func.now()
+            db.commit()
+
+def _enqueue(job_id: str):
+    with _executor_lock:
+        if _executor is None:
+            raise HTTPException(status_code=503, detail="Report workers are not running")
+        future = _executor.submit(run_job, job_id)
+    future.add_done_callback(lambda future: _mark_failed(job_id, future))
+
+def resume_jobs() -> int:
+    # Задания, оставшиеся после аварийной остановки: зависшие в running помечаются failed,
+    # queued ставятся в очередь снова (повторная постановка безопасна: выполнит только один процесс)
+    with SessionLocal() as db:
+        cutoff = db.scalar(select(func.now())) - timedelta(seconds=REPORT_JOB_TIMEOUT)
+        db.execute(
+            update(ReportJob)
+            .where(ReportJob.status == "running", ReportJob.started_at < cutoff)
+            .values(status="failed", error="Abandoned: the report process did not finish", finished_at=func.now())
+        )
+        db.commit()
+        queued = list(db.scalars(select(ReportJob.job_id).where(ReportJob.status == "queued")))
+    for job_id in queued:
+        _enqueue(job_id)
+    return len(queued)
+
+def start():
+    # Пул создаётся при запуске воркера. Процессы запускаются через forkserver (или spawn, где его нет):
+    # fork процесса с потоками слушателя шины и проверки реплик может унаследовать захваченные блокировки
+    global _executor
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=context)
+    try:
+        resumed = resume_jobs()
+    except Exception as e:
+        logger.warning("Cannot resume report jobs: %s", e)
+        return
+    if resumed:
+        logger.info("Resumed %s queued report jobs", resumed)
+
+def submit(db: Session, request: ReportJobCreate, username: str) -> ReportJob:
+    if request.format == ReportFormat.parquet and not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=400, detail="Parquet output requires pyarrow")
+
+    params = {"date_from": request.date_from, "date_to": request.date_to}
+    job = ReportJob(
+        job_id=uuid.uuid4().hex,
+        kind=request.kind.value,
+        format=request.format.value,
+        params=json.dumps({key: value.isoformat() if value else None for key, value in params.items()}),
+        status="queued",
+        created_by=username,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _enqueue(job.job_id)
+    return job
+
+def shutdown():
+    # Отменённые задания помечаются failed обратным вызовом _mark_failed
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,147 @@
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, func, text, insert
+
+from app.partitions import LOG_TABLES, add_months, create_month_partition, get_log_partitions, month_start
+
+load_dotenv()
+
+# Сколько дней журналы хранятся в рабочей базе и куда выгружаются архивы
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "365"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "archive/logs")
+CHUNK_SIZE = 10000
+
+class RetentionError(Exception):
+    pass
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def archive_path(archive_dir, table, suffix: str) -> Path:
+    # Повторная выгрузка того же месяца (например, после restore-logs) не перезаписывает прежний архив
+    path = Path(archive_dir) / table.schema / f"{table.name}__{suffix}.ndjson.gz"
+    if path.exists():
+        path = path.with_name(f"{table.name}__{suffix}_{datetime.now():%Y%m%d%H%M%S%f}.ndjson.gz")
+    return path
+
+def write_archive(conn, query, path: Path) -> int:
+    # Строки читаются серверным курсором и пишутся в архив порциями
+    if path.exists():
+        raise RetentionError(f"Archive {path} already exists")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    written = 0
+
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_SIZE).execute(query)
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+        for chunk in result.mappings().partitions():
+            archive.write("".join(
+                json.dumps(dict(row), default=_json_default, ensure_ascii=False) + "\n"
+                for row in chunk
+            ))
+            written += len(chunk)
+
+    if count_archive_rows(tmp_path) != written:
+        tmp_path.unlink()
+        raise RetentionError(f"Archive {path} is incomplete")
+
+    os.replace(tmp_path, path)
+    return written
+
+def count_archive_rows(path: Path) -> int:
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return sum(1 for _ in archive)
+
+def archive_partition(conn, table, name: str, month: date, archive_dir) -> int:
+    # Месяц целиком старше срока хранения: выгрузить секцию, сверить количество строк и удалить её
+    partition = f"{table.schema}.{name}"
+    conn.execute(text(f"LOCK TABLE {partition} IN SHARE MODE"))
+    expected = conn.execute(text(f"SELECT count(*) FROM {partition}")).scalar()
+
+    path = archive_path(archive_dir, table, f"y{month.year}m{month.month:02d}")
+    written = write_archive(conn, text(f"SELECT * FROM {partition}"), path) if expected else 0
+    if written != expected:
+        path.unlink(missing_ok=True)
+        raise RetentionError(f"{partition}: archived {written} rows, expected {expected}")
+
+    conn.execute(text(f"ALTER TABLE {table.schema}.{table.name} DETACH PARTITION {partition}"))
+    conn.execute(text(f"DROP TABLE {partition}"))
+    return written
+
+def archive_rows(conn, table, cutoff: datetime, archive_dir) -> int:
+    # Оставшиеся старые строки (секция по умолчанию или несекционированная таблица)
+    condition = table.c.change_time < cutoff
+    expected = conn.execute(select(func.count()).select_from(table).where(condition)).scalar()
+    if not expected:
+        return 0
+
+    path = archive_path(archive_dir, table, f"before_{cutoff:%Y%m%d}")
+    written = write_archive(conn, select(table).where(condition), path)
+    deleted = conn.execute(delete(table).where(condition)).rowcount if written == expected else None
+    if deleted != expected:
+        path.unlink(missing_ok=True)
+        raise RetentionError(f"{table.fullname}: archived {written}, deleted {deleted}, expected {expected}")
+    return written
+
+def archive_logs(engine, older_than_days: int = LOG_RETENTION_DAYS, archive_dir=LOG_ARCHIVE_DIR):
+    cutoff = datetime.combine(date.today() - timedelta(days=older_than_days), datetime.min.time())
+    archived = {}
+
+    for table in LOG_TABLES:
+        total = 0
+        if engine.dialect.name == "postgresql":
+            with engine.connect() as conn:
+                partitions = get_log_partitions(conn, table)
+            for name, month in partitions:
+                if add_months(month, 1) > month_start(cutoff.date()):
+                    continue
+                # Каждая секция в своей транзакции: при ошибке сверки секция остаётся на месте
+                with engine.begin() as conn:
+                    total += archive_partition(conn, table, name, month, archive_dir)
+
+        options = {"isolation_level": "REPEATABLE READ"} if engine.dialect.name == "postgresql" else {}
+        with engine.connect().execution_options(**options) as conn:
+            with conn.begin():
+                total += archive_rows(conn, table, cutoff, archive_dir)
+
+        archived[table.fullname] = total
+    return archived
+
+def restore_archive(engine, path) -> int:
+    # Загрузка архива обратно в таблицу журнала (для проверок и аудита)
+    path = Path(path)
+    table_name = path.name.split("__", 1)[0]
+    table = next((table for table in LOG_TABLES if table.name == table_name), None)
+    if table is None:
+        raise RetentionError(f"Unknown log table for archive {path}")
+
+    restored = 0
+    months = set()
+    with engine.begin() as conn, gzip.open(path, "rt", encoding="utf-8") as archive:
+        chunk = []
+        for line in archive:
+            row = json.loads(line)
+            row["change_time"] = datetime.fromisoformat(row["change_time"])
+            months.add(month_start(row["change_time"].date()))
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                restored += _insert_chunk(conn, table, chunk, months)
+                chunk = []
+        if chunk:
+            restored += _insert_chunk(conn, table, chunk, months)
+    return restored
+
+def _insert_chunk(conn, table, chunk, months) -> int:
+    if conn.dialect.name == "postgresql":
+        for month in months:
+            create_month_partition(conn, table, month)
+        months.clear()
+    conn.execute(insert(table), chunk)
+    return len(chunk)
@@ -0,0 +1,20 @@
+from typing import Annotated, List, Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app import autocomplete
+from app.auth import get_current_user
+from app.schemas import User, AutocompleteKind, AutocompleteItem
+
+router = APIRouter()
+
+# Маршрут для подсказок по названиям книг, авторам и фамилиям читателей.
+# Отвечает из индекса в памяти, без запросов к БД
+@router.get("/autocomplete", response_model=List[AutocompleteItem])
+def get_suggestions(
+    current_user: Annotated[User, Depends(get_current_user)],
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: Optional[AutocompleteKind] = None,
+    limit: int = Query(10, ge=1, le=50),
+):
+    return autocomplete.search(q, kind.value if kind is not None else None, limit)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from typing import Annotated
+
+import orjson
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app import invalidation, schemas
+from app.admission import route_class
+from app.auth import get_current_user
+from app.database import SessionLocal, engine
+from app.replicas import READ_METHODS, DatabaseRoute, db_route
+from app.schemas import User
+from app.serialization import dumps
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# Заголовки исходного запроса, которые передаются подзапросам
+FORWARDED_HEADERS = {b"authorization", b"accept-language"}
+
+def _encode_result(status_code: int, content_type, body: bytes) -> bytes:
+    # Тело JSON-ответа вставляется в результат как есть, без повторного разбора
+    if not body:
+        body = b"null"
+    elif not (content_type and "json" in content_type):
+        body = dumps(body.decode(errors="replace"))
+    return b'{"status":%d,"body":%s}' % (status_code, body)
+
+def _error(status_code: int, detail) -> bytes:
+    return _encode_result(status_code, "application/json", dumps({"detail": detail}))
+
+async def dispatch(request: Request, sub_request: schemas.BatchSubRequest, state: dict) -> tuple[int, bytes]:
+    path, _, query = sub_request.path.partition("?")
+    if not path.startswith("/api/"):
+        path = "/api" + path
+    if path.rstrip("/") == "/api/batch":
+        return 400, _error(400, "Nested batch requests are not allowed")
+
+    body = orjson.dumps(sub_request.body) if sub_request.body is not None else b""
+    headers = [(name, value) for name, value in request.scope["headers"] if name in FORWARDED_HEADERS]
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    scope = {
+        key: value for key, value in request.scope.items()
+        if key not in ("route", "endpoint", "path_params") and not key.startswith("fastapi_")
+    }
+    scope.update({
+        "method": sub_request.method.value,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+        "state": state,
+    })
+
+    body_sent = False
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Подзапрос не может быть прерван клиентом отдельно от пакета
+        await asyncio.Event().wait()
+
+    status_code = 500
+    content_type = None
+    chunks = []
+    async def send(message):
+        nonlocal status_code, content_type
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            content_type = Headers(raw=message.get("headers", [])).get("content-type")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    # Каждый подзапрос проходит лимиты своего класса (AdmissionMiddleware), как отдельный запрос
+    gate = rejection = None
+    admission = request.scope.get("admission")
+    name = route_class(scope["method"], path)
+    if admission is not None and name is not None:
+        gate, rejection = await admission.acquire(scope, name)
+    try:
+        if rejection is not None:
+            await rejection(scope, receive, send)
+        else:
+            # Зависимости подзапроса закрываются сразу после него, а не в конце пакета
+            async with AsyncExitStack() as stack:
+                scope["fastapi_middleware_astack"] = stack
+                await request.app.router(scope, receive, send)
+    except StarletteHTTPException as e:
+        return e.status_code, _error(e.status_code, e.detail)
+    finally:
+        if gate is not None:
+            gate.release()
+    return status_code, _encode_result(status_code, content_type, b"".join(chunks))
+
+# Маршрут для выполнения нескольких запросов к API за одно обращение. Сотрудник проверяется один раз,
+# подзапросы выполняются по порядку в общей сессии. transaction=true объединяет их в одну транзакцию:
+# при первой ошибке она откатывается, а оставшиеся подзапросы не выполняются (статус 424).
+# GET-подзапросы читают с реплик, пока в пакете (или незадолго до него) не было успешной записи;
+# «липкое» окно открывается, только если запись действительно выполнена
+@router.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    batch: schemas.BatchRequest,
+):
+    connection = transaction = None
+    if batch.transaction:
+        connection = await run_in_threadpool(engine.connect)
+        transaction = connection.begin()
+        if connection.dialect.name == "sqlite":
+            # pysqlite сам не открывает транзакцию, и RELEASE SAVEPOINT без неё фиксирует изменения
+            await run_in_threadpool(connection.exec_driver_sql, "BEGIN")
+        # Коммиты обработчиков освобождают точки сохранения внутри транзакции пакета
+        db = SessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+        db.info["deferred_invalidation"] = True
+    else:
+        db = SessionLocal()
+    state = {"db": db, "user": current_user}
+
+    # Маршрут самого пакета (ReadRoutingMiddleware) считает его записью; решение принимается ниже
+    outer_route = db_route.get() or DatabaseRoute(read_only=False)
+    primary = outer_route.sticky or batch.transaction
+    wrote = False
+    outer_route.wrote = False
+    # X-Database-Route пакета описывает его подзапросы, а не проверку токена
+    outer_route.target = "primary" if batch.transaction else None
+
+    results = []
+    failed = False
+    try:
+        for sub_request in batch.requests:
+            if failed:
+                results.append(_error(424, "Not executed: an earlier request in the batch failed"))
+                continue
+            is_read = sub_request.method.value in READ_METHODS
+            route = DatabaseRoute(read_only=is_read and not primary, sticky=primary)
+            token = db_route.set(route)
+            try:
+                status_code, result = await dispatch(request, sub_request, state)
+            except Exception:
+                logger.exception("Batch sub-request %s %s failed", sub_request.method.value, sub_request.path)
+                await run_in_threadpool(db.rollback)
+                status_code, result = 500, _error(500, "Internal Server Error")
+            finally:
+                db_route.reset(token)
+            results.append(result)
+            failed = batch.transaction and status_code >= 400
+            if not is_read and status_code < 400:
+                # Следующие чтения пакета должны видеть эту запись
+                primary = wrote = True
+            if route.target == "primary" or outer_route.target is None:
+                outer_route.target = route.target or outer_route.target
+
+        if transaction is not None:
+            await run_in_threadpool(transaction.rollback if failed else transaction.commit)
+            await run_in_threadpool(invalidation.finish, db, not failed)
+        outer_route.wrote = wrote and not failed
+    finally:
+        await run_in_threadpool(db.close)
+        if connection is not None:
+            await run_in_threadpool(connection.close)
+
+    return Response(b'{"results":[%s]}' % b",".join(results), media_type="application/json")
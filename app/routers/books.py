@@ -1,72 +1,79 @@
-from typing import Annotated, List
-from unicodedata import category
+from typing import Annotated, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app import schemas, crud
+from app import schemas, crud, media, popularity, recommendations
 from app.crud import get_category, get_genre
-from app.database import SessionLocal
+from app.database import get_db
 from app.auth import get_current_user
-from app.models import Category, Publisher, Book, BookCopy, Genre, AuthorBook, Author, BookLocation, Loan
+from app.models import Category, Publisher, Book, BookCopy, Genre, AuthorBook, Author, BookLocation
 from app.schemas import User, BookCopyInfo, BookCopyCreateSchema, BookCopyUpdateSchema
+from app.coalescing import coalesce
+from app.serialization import FastJSONResponse, list_response, parse_fields
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.expire_all()
-
-# Маршрут для получения списка книг
+# Маршрут для получения списка книг. format=columnar возвращает колонки со словарями повторяющихся строк,
+# thumb=<размер> заменяет photo ссылкой на миниатюру, fields=copy_id,status оставляет только перечисленные поля
+# (и не выполняет соединения, нужные лишь для остальных)
+# Одинаковые одновременные запросы выполняются один раз (app/coalescing.py)
 @router.get("/books", response_model=List[schemas.BookCopyInfo])
 def get_book_copies(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
+    list_format: schemas.ListFormat = Query(schemas.ListFormat.rows, alias="format"),
+    thumb: Optional[int] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    book_locations = crud.get_books(db=db)
-
-    return [
-        schemas.BookCopyInfo(
-            copy_id=book_location.copy.copy_id,
-            book=book_location.copy.book.book_name,
-            genre=book_location.copy.book.genre.genre_name,
-            author=[
-                f"{author.author_lname} {author.author_fname} {author.author_mname or ''}".strip()
-                for author in db.query(Author).join(AuthorBook).filter(AuthorBook.book_id == book_location.copy.book.book_id).all()
-            ],
-            book_location=f"{book_location.shelf.rack.section.section_name}, {book_location.shelf.rack.rack_name}, {book_location.shelf.shelf_number} полка",
-            photo=book_location.copy.photo,
-            status=book_location.copy.status,
-        )
-        for book_location in book_locations
-    ]
+    fields = parse_fields(fields, schemas.BOOK_COPY_FIELDS)
+    return coalesce(request, lambda: list_response(
+        media.with_thumbnails(crud.get_book_copy_rows(db=db, fields=fields), thumb),
+        schemas.BookCopyInfoList if fields is None else None, list_format,
+        dictionary_fields=("book", "genre", "author", "book_location", "status"),
+    ))
+
+# Маршрут для получения самых популярных книг за неделю, месяц или всё время.
+# Объявлен до /books/{copy_id}, иначе "popular" будет принят за ID
+@router.get("/books/popular", response_model=List[schemas.PopularBook])
+def get_popular_books(
+    current_user: Annotated[User, Depends(get_current_user)],
+    period: schemas.PopularityPeriod = schemas.PopularityPeriod.week,
+    genre_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    return popularity.get_popular(db, period, genre_id=genre_id, category_id=category_id, limit=limit)
 
-# Маршрут для получения книги по ID
-@router.get("/books/{copy_id}", response_model=BookCopyInfo)
+# Маршрут для получения книги по ID вместе с книгами, которые брали читатели этой книги.
+# fields= работает как в списке; рекомендации считаются, только если запрошено also_borrowed
+@router.get("/books/{copy_id}", response_model=schemas.BookCopyDetail)
 def get_book_by_id(
     current_user: Annotated[User, Depends(get_current_user)],
     copy_id: int,
+    thumb: Optional[int] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    book_location = crud.get_book(db=db, copy_id=copy_id)
-
-    if book_location is None:
+    detail_fields = parse_fields(fields, schemas.BOOK_COPY_DETAIL_FIELDS)
+    row_fields = None
+    if detail_fields is not None:
+        # copy_id нужен, чтобы отличить отсутствующую книгу от пустого набора полей
+        row_fields = tuple(field for field in schemas.BOOK_COPY_FIELDS if field in detail_fields) or ("copy_id",)
+    rows = media.with_thumbnails(crud.get_book_copy_rows(db=db, copy_id=copy_id, fields=row_fields), thumb)
+
+    if not rows:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    return schemas.BookCopyInfo(
-        copy_id=book_location.copy.copy_id,
-        book=book_location.copy.book.book_name,
-        genre=book_location.copy.book.genre.genre_name,
-        author=[
-            f"{author.author_lname} {author.author_fname} {author.author_mname or ''}".strip()
-            for author in db.query(Author).join(AuthorBook).filter(AuthorBook.book_id == book_location.copy.book.book_id).all()
-        ],
-        book_location=f"{book_location.shelf.rack.section.section_name or 'Основной склад'}, {book_location.shelf.rack.rack_name or 'На складе'}, {book_location.shelf.shelf_number or 'На складе'} полка",
-        photo=book_location.copy.photo,
-        status=book_location.copy.status,
-    )
+    row = rows[0]
+    if detail_fields is None or "also_borrowed" in detail_fields:
+        book_id = db.query(BookCopy.book_id).filter(BookCopy.copy_id == copy_id).scalar()
+        row["also_borrowed"] = recommendations.get_neighbours(db, book_id)
+    if detail_fields is None:
+        return row
+    return FastJSONResponse({field: row[field] for field in detail_fields})
 
 @router.post("/books/new", response_model=schemas.BookCreateSchema)
 def add_book(
@@ -221,6 +228,43 @@ def update_book(
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+# Маршрут для загрузки фотографии экземпляра. Миниатюры создаются в фоне
+@router.post("/books/{copy_id}/photo", response_model=schemas.PhotoInfo, openapi_extra=media.UPLOAD_OPENAPI)
+async def upload_book_photo(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    copy_id: int,
+    db: Session = Depends(get_db),
+):
+    # Тело читается потоком после проверки заголовков и записи, без открытой транзакции
+    media.check_upload(request)
+    await run_in_threadpool(media.find_owner, db, BookCopy, copy_id, "Book not found")
+
+    name = await media.receive_upload(request)
+    await run_in_threadpool(media.attach_photo, db, BookCopy, copy_id, name, "Book not found")
+
+    return {"photo": name}
+
+# Маршрут для списания экземпляров по списку ID или по статусу (например, "Повреждена").
+# Выполняется одной транзакцией из трёх DELETE, возвращает число удалённых строк
+@router.post("/books/bulk-delete", response_model=schemas.BookBulkDeleteResult)
+def delete_books(
+    current_user: Annotated[User, Depends(get_current_user)],
+    selection: schemas.BookBulkDelete,
+    db: Session = Depends(get_db)
+):
+    try:
+        copy_ids = selection.copy_ids
+        if copy_ids is None:
+            copy_ids = crud.get_copy_ids_by_status(db, selection.status)
+        counts = crud.delete_book_copies(db, copy_ids)
+        db.commit()
+        return counts
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/books/{copy_id}", status_code=204)
 def delete_book_by_id(
     current_user: Annotated[User, Depends(get_current_user)],
@@ -228,29 +272,14 @@ def delete_book_by_id(
     db: Session = Depends(get_db)
 ):
     try:
-        copy = db.query(BookCopy).filter(BookCopy.copy_id == copy_id).first()
-        if not copy:
+        counts = crud.delete_book_copies(db, [copy_id])
+        if not counts["copies"]:
+            db.rollback()
             raise HTTPException(status_code=404, detail="Book not found")
-
-        # Найти все записи, связанные с этой копией книги в таблице loans
-        loans = db.query(Loan).filter(Loan.copy_id == copy_id).all()
-        if loans:
-            # Удалить или обработать записи из таблицы loans
-            for loan in loans:
-                db.delete(loan)
-
-        # Найти все записи, связанные с этой копией книги в таблице book_locations
-        book_locations = db.query(BookLocation).filter(BookLocation.copy_id == copy_id).all()
-        if book_locations:
-            # Удалить записи из таблицы book_locations
-            for location in book_locations:
-                db.delete(location)
-
-        db.delete(copy)
         db.commit()
 
-        return {"detail": "Book deleted successfully"}
-
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
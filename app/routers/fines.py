@@ -1,43 +1,28 @@
 from typing import List, Annotated
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from app import models, schemas, crud
 from app.auth import get_current_user
-from app.database import SessionLocal
+from app.database import get_db
 from app.models import Fine
 from app.schemas import User, FineUpdate
+from app.coalescing import coalesce
+from app.serialization import list_response
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.expire_all()
-
-# Маршрут для получения списка всех штрафов
+# Маршрут для получения списка всех штрафов. format=columnar возвращает колонки со словарями повторяющихся строк
+# Одинаковые одновременные запросы выполняются один раз (app/coalescing.py)
 @router.get("/fines", response_model=List[schemas.FineInfo])
 def get_fines(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
+    list_format: schemas.ListFormat = Query(schemas.ListFormat.rows, alias="format"),
     db: Session = Depends(get_db)
 ):
-    fine_cards = crud.get_fines(db=db)
-
-    return [
-        schemas.FineInfo(
-            fine_id=fine_card.fine.fine_id,
-            user_name=f"{fine_card.user.user_lname} {fine_card.user.user_fname} {fine_card.user.user_mname}",
-            user_email=fine_card.user.user_email,
-            fine_amount=fine_card.fine.fine_amount,
-            date_received=fine_card.fine.fine_date,
-            unreturned_books=[
-                book.book_name for book in crud.get_unreturned_books_for_user(db=db, user_id=fine_card.user.user_id)
-            ],
-            paid=fine_card.fine.fine_paid,
-        )
-        for fine_card in fine_cards
-    ]
+    return coalesce(request, lambda: list_response(
+        crud.get_fine_rows(db=db), schemas.FineInfoList, list_format, dictionary_fields=("unreturned_books",),
+    ))
 
 # Маршрут для получения информации о конкретном штрафе по ID
 @router.get("/fines/{fine_id}", response_model=schemas.FineInfo)
@@ -46,20 +31,10 @@ def get_fine_by_id(
     fine_id: int,
     db: Session = Depends(get_db)
 ):
-    fine_card = crud.get_fine(db=db, fine_id=fine_id)
-    if fine_card is None:
+    rows = crud.get_fine_rows(db=db, fine_id=fine_id)
+    if not rows:
         raise HTTPException(status_code=404, detail="Fine not found")
-    return schemas.FineInfo(
-        fine_id=fine_card.fine.fine_id,
-        user_name=f"{fine_card.user.user_lname} {fine_card.user.user_fname} {fine_card.user.user_mname}",
-        user_email=fine_card.user.user_email,
-        fine_amount=fine_card.fine.fine_amount,
-        date_received=fine_card.fine.fine_date,
-        unreturned_books=[
-            book.book_name for book in crud.get_unreturned_books_for_user(db=db, user_id=fine_card.user.user_id)
-        ],
-        paid=fine_card.fine.fine_paid,
-    )
+    return rows[0]
 
 @router.patch("/fines/{fine_id}", response_model=schemas.FineUpdate)
 def update_fine(
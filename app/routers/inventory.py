@@ -0,0 +1,40 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app import inventory, schemas
+from app.auth import get_current_user
+from app.database import get_db
+from app.schemas import User
+from app.serialization import FastJSONResponse
+
+router = APIRouter()
+
+# Маршрут для сверки инвентаризации полки, стеллажа или раздела. Тело — отсканированные ID
+# экземпляров через пробел, запятую или перевод строки (подходит и JSON-массив), читается потоком.
+# fix=true переносит найденные на полке чужие экземпляры на эту полку
+@router.post("/inventory/reconcile", response_model=schemas.InventoryReport)
+async def reconcile_inventory(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    scope: schemas.InventoryScope,
+    scope_id: int,
+    fix: bool = False,
+    db: Session = Depends(get_db),
+):
+    try:
+        scanned = await inventory.read_copy_ids(request.stream())
+    except (ValueError, OverflowError) as e:
+        # OverflowError — число вне диапазона int64
+        raise HTTPException(status_code=400, detail=f"Cannot parse copy IDs: {e}")
+
+    try:
+        report = await run_in_threadpool(inventory.reconcile, db, scope, scope_id, scanned, fix)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(report)
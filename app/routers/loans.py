@@ -1,7 +1,7 @@
 from datetime import date
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
-from app.database import SessionLocal
+from app.database import get_db
 from app.schemas import BookCopyCreateSchema, User
 from app.auth import get_current_user
 from sqlalchemy.orm import Session
@@ -9,16 +9,11 @@ from sqlalchemy.orm import Session
 from app import schemas
 from app import crud
 from app import models
+from app import popularity
+from app import recommendations
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.expire_all()
-
 @router.post("/loans/new", response_model=schemas.LoanCreate)
 def get_readers(
     current_user: Annotated[User, Depends(get_current_user)],
@@ -45,6 +40,7 @@ def get_readers(
         copy_id=available_copy.copy_id
     )
     db.add(new_loan)
+    popularity.record_loan(db, book.book_id, new_loan.loan_date)
     db.commit()
     db.refresh(new_loan)
 
@@ -55,6 +51,7 @@ def get_readers(
     # Associate the loan with a user card
     user_card = db.query(models.UserCard).filter(models.UserCard.user_id == loan_data.user_id).first()
     if user_card:
+        recommendations.record_loan(db, user_card.user_id, book.book_id, new_loan.loan_id)
         user_card.loan_id = new_loan.loan_id
         db.commit()
 
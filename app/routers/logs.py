@@ -0,0 +1,104 @@
+from datetime import datetime
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.auth import get_current_user
+from app.database import get_db
+from app.models import CardLog, BookLog, FineLog, OverallLog
+from app.schemas import User, LogKind, LogPage
+
+router = APIRouter()
+
+# Вид журнала -> (модель, столбец ID записи, столбец сущности)
+LOG_KINDS = {
+    LogKind.cards: (CardLog, CardLog.card_log_id, CardLog.card_id),
+    LogKind.books: (BookLog, BookLog.book_log_id, BookLog.book_id),
+    LogKind.fines: (FineLog, FineLog.fine_log_id, FineLog.fine_id),
+    LogKind.overall: (OverallLog, OverallLog.overall_log_id, OverallLog.table_name),
+}
+
+def encode_cursor(change_time: datetime, log_id: int) -> str:
+    return f"{change_time.isoformat()}|{log_id}"
+
+def decode_cursor(cursor: str):
+    try:
+        change_time, log_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(change_time), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Маршрут для чтения журнала изменений с фильтром по времени и keyset-пагинацией.
+# Условия по change_time позволяют PostgreSQL читать только нужные месячные секции
+@router.get("/logs/{kind}", response_model=LogPage)
+def get_logs(
+    kind: LogKind,
+    current_user: Annotated[User, Depends(get_current_user)],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    entity_id: Optional[int] = None,
+    table_name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    model, id_column, entity_column = LOG_KINDS[kind]
+    is_overall = kind == LogKind.overall
+
+    if is_overall and entity_id is not None:
+        raise HTTPException(status_code=400, detail="Use table_name to filter the overall log")
+    if not is_overall and table_name is not None:
+        raise HTTPException(status_code=400, detail="Use entity_id to filter this log")
+
+    columns = [
+        id_column,
+        entity_column,
+        model.table_field,
+        model.operation_type,
+        model.prev_value,
+        getattr(model, "new_value", None),
+        model.change_time,
+    ]
+    query = db.query(*[column for column in columns if column is not None])
+
+    if date_from is not None:
+        query = query.filter(model.change_time >= date_from)
+    if date_to is not None:
+        query = query.filter(model.change_time < date_to)
+    if entity_id is not None:
+        query = query.filter(entity_column == entity_id)
+    if table_name is not None:
+        query = query.filter(entity_column == table_name)
+    if cursor is not None:
+        cursor_time, cursor_id = decode_cursor(cursor)
+        # Отдельное условие по change_time нужно для отсечения секций
+        query = query.filter(
+            model.change_time <= cursor_time,
+            tuple_(model.change_time, id_column) < tuple_(cursor_time, cursor_id),
+        )
+
+    rows = query.order_by(model.change_time.desc(), id_column.desc()).limit(limit + 1).all()
+
+    items = [
+        schemas.LogEntry(
+            log_id=row[0],
+            entity_id=None if is_overall else row[1],
+            table_name=row[1] if is_overall else None,
+            table_field=row.table_field,
+            operation_type=row.operation_type,
+            prev_value=row.prev_value,
+            new_value=getattr(row, "new_value", None),
+            change_time=row.change_time,
+        )
+        for row in rows[:limit]
+    ]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.change_time, last.log_id)
+
+    return LogPage(items=items, next_cursor=next_cursor)
@@ -0,0 +1,51 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from app import media
+
+router = APIRouter()
+
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+# Имя файла — хэш содержимого, поэтому ответ не меняется и кэшируется браузером навсегда
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+# Маршрут для получения фотографии или её миниатюры (size из THUMBNAIL_SIZES).
+# Поддерживаются Range-запросы; сервер с расширением pathsend отдаёт файл без копирования
+@router.get("/photos/{name}")
+def get_photo(request: Request, name: str, size: Optional[int] = None):
+    match = media.PHOTO_NAME.match(name)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    media.check_thumbnail_size(size)
+
+    digest = name.split(".")[0]
+    path = media.original_path(name)
+    etag = f'"{digest}"'
+    media_type = MEDIA_TYPES[match.group(1)]
+    cache_control = IMMUTABLE
+    if size is not None:
+        thumbnail = media.thumbnail_path(name, size)
+        if os.path.exists(thumbnail):
+            path, etag, media_type = thumbnail, f'"{digest}-{size}"', "image/jpeg"
+        else:
+            # Миниатюра ещё не готова: отдаётся оригинал, который нельзя кэшировать под этим адресом
+            cache_control = "no-cache"
+
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers)
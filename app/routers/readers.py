@@ -1,71 +1,55 @@
 from math import expm1
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic.v1 import NoneStr
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app import models, schemas, crud
+from app import models, schemas, crud, media, reader_import
 from app.auth import get_current_user
 from app.crud import create_reader
-from app.database import SessionLocal
+from app.database import get_db
 from app.models import UserCard, FineCard, BookCopy, Book
 from app.schemas import User, Reader, ReaderCreate, ReaderUpdate
+from app.coalescing import coalesce
+from app.serialization import FastJSONResponse, list_response, parse_fields
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.expire_all()
-
-# Маршрут для получения списка пользователей
+# Маршрут для получения списка пользователей. format=columnar возвращает колонки со словарями повторяющихся строк,
+# fields=user_id,fines оставляет только перечисленные поля (сумма штрафов и книги считаются, только если запрошены)
+# Одинаковые одновременные запросы выполняются один раз (app/coalescing.py)
 @router.get("/readers", response_model=List[schemas.UserInfo])
 def get_readers(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
+    list_format: schemas.ListFormat = Query(schemas.ListFormat.rows, alias="format"),
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    users = db.query(UserCard).all()
-
-    return [
-        schemas.UserInfo(
-            user_id=user.user_id,
-            user_name=f"{user.user_lname} {user.user_fname} {user.user_mname}",
-            user_email=user.user_email,
-            registration_date=user.registration_date,
-            borrowed_books=[
-                f"{book.book_name}"
-                for book in db.query(Book).join(BookCopy).filter(BookCopy.copy_id == user.loan_id)
-            ],
-            fines=sum(fine.fine_amount for fine in user.fines),
-            status=user.status,
-        )
-        for user in users
-    ]
+    fields = parse_fields(fields, schemas.USER_INFO_FIELDS)
+    return coalesce(request, lambda: list_response(
+        crud.get_reader_rows(db=db, fields=fields), schemas.UserInfoList if fields is None else None, list_format,
+        dictionary_fields=("borrowed_books", "status"),
+    ))
 
 # Маршрут для получения информации о пользователе по ID
 @router.get("/readers/{reader_id}", response_model=schemas.UserInfo)
 def get_reader_by_id(
     reader_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    user = db.query(UserCard).filter(UserCard.user_id == reader_id).first()
-
-    return schemas.UserInfo(
-        user_id=user.user_id,
-        user_name=f"{user.user_lname} {user.user_fname} {user.user_mname}",
-        user_email=user.user_email,
-        registration_date=user.registration_date,
-        borrowed_books=[
-            f"{book.book_name}"
-            for book in db.query(Book).join(BookCopy).filter(BookCopy.copy_id == user.loan_id)
-        ],
-        fines=sum(fine.fine_amount for fine in user.fines),
-        status=user.status,
-    )
+    fields = parse_fields(fields, schemas.USER_INFO_FIELDS)
+    rows = crud.get_reader_rows(db=db, reader_id=reader_id, fields=fields)
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="Reader not found")
+
+    if fields is None:
+        return rows[0]
+    return FastJSONResponse(rows[0])
 
 @router.post("/readers/new", response_model=Reader)
 def add_reader(
@@ -102,6 +86,38 @@ def update_reader(
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+# Маршрут для массовой регистрации читателей из CSV (с заголовком) или JSON-массива.
+# Корректные строки загружаются одной транзакцией, для остальных возвращаются ошибки по номеру строки
+@router.post("/readers/import", response_model=schemas.ReaderImportResult)
+def import_readers(
+    current_user: Annotated[User, Depends(get_current_user)],
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    rows = reader_import.read_rows(file)
+    try:
+        return reader_import.import_readers(db, rows)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Маршрут для загрузки фотографии читателя. Миниатюры создаются в фоне
+@router.post("/readers/{reader_id}/photo", response_model=schemas.PhotoInfo, openapi_extra=media.UPLOAD_OPENAPI)
+async def upload_reader_photo(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    reader_id: int,
+    db: Session = Depends(get_db),
+):
+    # Тело читается потоком после проверки заголовков и записи, без открытой транзакции
+    media.check_upload(request)
+    await run_in_threadpool(media.find_owner, db, UserCard, reader_id, "Reader not found")
+
+    name = await media.receive_upload(request)
+    await run_in_threadpool(media.attach_photo, db, UserCard, reader_id, name, "Reader not found")
+
+    return {"photo": name}
+
 @router.delete("/readers/{reader_id}", status_code=204)
 def delete_reader(
     current_user: Annotated[User, Depends(get_current_user)],
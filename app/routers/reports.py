@@ -0,0 +1,63 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from app import fine_projection, report_jobs, schemas
+from app.auth import get_current_user
+from app.database import get_db
+from app.models import ReportJob
+from app.schemas import User
+
+router = APIRouter()
+
+# Маршрут для оценки штрафов по всем выдачам при одной или нескольких политиках:
+# сумма, число оштрафованных выдач (в том числе открытых), перцентили и распределение сумм
+@router.post("/reports/fine-projection", response_model=schemas.FineProjection)
+def project_fines(
+    current_user: Annotated[User, Depends(get_current_user)],
+    projection: schemas.FineProjectionRequest,
+    db: Session = Depends(get_db),
+):
+    return fine_projection.project(db, projection.policies, projection.as_of, projection.buckets)
+
+# Маршрут для запуска построения отчёта в фоне. Ход выполнения — GET /reports/jobs/{job_id}
+@router.post("/reports/jobs", response_model=schemas.ReportJobInfo, status_code=202)
+def create_report_job(
+    current_user: Annotated[User, Depends(get_current_user)],
+    request: schemas.ReportJobCreate,
+    db: Session = Depends(get_db),
+):
+    return report_jobs.submit(db, request, current_user.username)
+
+def get_job(db: Session, job_id: str) -> ReportJob:
+    job = db.get(ReportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+# Маршрут для получения состояния задания: queued, running, done или failed
+@router.get("/reports/jobs/{job_id}", response_model=schemas.ReportJobInfo)
+def get_report_job(
+    current_user: Annotated[User, Depends(get_current_user)],
+    job_id: str,
+    db: Session = Depends(get_db),
+):
+    return get_job(db, job_id)
+
+# Маршрут для скачивания готового отчёта
+@router.get("/reports/jobs/{job_id}/download")
+def download_report(
+    current_user: Annotated[User, Depends(get_current_user)],
+    job_id: str,
+    db: Session = Depends(get_db),
+):
+    job = get_job(db, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Report is not ready: {job.status}")
+    return FileResponse(
+        report_jobs.file_path(job),
+        media_type=report_jobs.MEDIA_TYPES[job.format],
+        filename=f"{job.kind}-{job.job_id}.{job.format}",
+    )
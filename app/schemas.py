@@ -1,8 +1,8 @@
-from cryptography.fernet import Fernet
-from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator, model_validator
+from typing import Any, Literal, Optional, List
+from datetime import date, datetime
 from decimal import Decimal
+from enum import Enum
 
 class Token(BaseModel):
     access_token: str
@@ -21,8 +21,7 @@ class SectionCreate(SectionBase):
 class Section(SectionBase):
     section_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Rack схемы
 class RackBase(BaseModel):
@@ -36,8 +35,7 @@ class Rack(RackBase):
     rack_id: int
     section: Optional[Section]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Shelf схемы
 class ShelfBase(BaseModel):
@@ -51,8 +49,7 @@ class Shelf(ShelfBase):
     shelf_id: int
     rack: Optional[Rack]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Author схемы
 class AuthorBase(BaseModel):
@@ -80,8 +77,7 @@ class AuthorCreate(AuthorBase):
 class Author(AuthorBase):
     author_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Genre схемы
 class GenreBase(BaseModel):
@@ -93,8 +89,7 @@ class GenreCreate(GenreBase):
 class Genre(GenreBase):
     genre_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Category схемы
 class CategoryBase(BaseModel):
@@ -106,8 +101,7 @@ class CategoryCreate(CategoryBase):
 class Category(CategoryBase):
     category_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Publisher схемы
 class PublisherBase(BaseModel):
@@ -119,8 +113,7 @@ class PublisherCreate(PublisherBase):
 class Publisher(PublisherBase):
     publisher_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Book схемы
 class BookBase(BaseModel):
@@ -157,8 +150,7 @@ class Book(BookBase):
     category: Optional[Category]
     publisher: Optional[Publisher]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # BookCopy схемы
 class BookCopyBase(BaseModel):
@@ -175,11 +167,31 @@ class BookCopyUpdateSchema(BaseModel):
 class BookCopyCreate(BookCopyBase):
     pass
 
+# Списание экземпляров (/books/bulk-delete): по списку ID или по статусу
+class BookBulkDelete(BaseModel):
+    copy_ids: Optional[List[int]] = None
+    status: Optional[str] = None
+
+    @model_validator(mode='after')
+    def check_selector(self):
+        if (self.copy_ids is None) == (self.status is None):
+            raise ValueError('Exactly one of copy_ids or status must be given')
+        return self
+
+class BookBulkDeleteResult(BaseModel):
+    copies: int
+    book_locations: int
+    loans: int
+
 class BookCopy(BookCopyBase):
     copy_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+# Формат ответа списков: строки или колонки (format=columnar)
+class ListFormat(str, Enum):
+    rows = "rows"
+    columnar = "columnar"
 
 class BookCopyInfo(BaseModel):
     copy_id: int
@@ -190,6 +202,37 @@ class BookCopyInfo(BaseModel):
     photo: Optional[str] = None
     status: str
 
+BookCopyInfoList = TypeAdapter(List[BookCopyInfo])
+
+# Поля, которые можно запросить параметром fields=, в порядке ответа
+BOOK_COPY_FIELDS = tuple(BookCopyInfo.model_fields)
+
+# Рейтинг популярности (/books/popular)
+class PopularityPeriod(str, Enum):
+    week = "week"
+    month = "month"
+    all = "all"
+
+class PopularBook(BaseModel):
+    book_id: int
+    book_name: str
+    genre: str
+    category: str
+    loans: int
+
+class BookRecommendation(BaseModel):
+    book_id: int
+    book_name: str
+    readers: int
+
+class BookCopyDetail(BookCopyInfo):
+    also_borrowed: List[BookRecommendation] = []
+
+BOOK_COPY_DETAIL_FIELDS = tuple(BookCopyDetail.model_fields)
+
+class PhotoInfo(BaseModel):
+    photo: str
+
 # BookLocation схемы
 class BookLocationBase(BaseModel):
     shelf_id: int
@@ -202,8 +245,7 @@ class BookLocation(BookLocationBase):
     shelf: Optional[Shelf]
     book: Optional[Book]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # AuthorBook схемы
 class AuthorBookBase(BaseModel):
@@ -217,8 +259,7 @@ class AuthorBook(AuthorBookBase):
     author: Optional[Author]
     book: Optional[Book]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # GenreBook схемы
 class GenreBookBase(BaseModel):
@@ -232,8 +273,7 @@ class GenreBook(GenreBookBase):
     genre: Optional[Genre]
     book: Optional[Book]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Loan схемы
 class LoanBase(BaseModel):
@@ -248,8 +288,7 @@ class Loan(LoanBase):
     loan_id: int
     book: Optional[Book]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Reader схемы
 class ReaderBase(BaseModel):
@@ -272,8 +311,7 @@ class ReaderUpdate(BaseModel):
     status: Optional[str] = None
     photo: Optional[str] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ReaderDelete(BaseModel):
     user_lname: Optional[str] = None
@@ -288,11 +326,26 @@ class ReaderDelete(BaseModel):
 class ReaderCreate(ReaderBase):
     pass
 
+# Строка массового импорта читателей (/readers/import); фотография загружается отдельно
+class ReaderImport(ReaderBase):
+    photo: Optional[str] = Field(None, max_length=100)
+    # Значения ограничения user_cards в БД: строка с другим статусом сорвала бы весь COPY
+    status: Literal['Активный', 'Неактивный'] = 'Активный'
+
+ReaderImportList = TypeAdapter(List[ReaderImport])
+
+class ReaderImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ReaderImportResult(BaseModel):
+    imported: int
+    errors: List[ReaderImportError]
+
 class Reader(ReaderBase):
     user_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class User(BaseModel):
     username: str
@@ -312,6 +365,10 @@ class UserInfo(BaseModel):
     fines: Optional[Decimal] = None
     status: str
 
+UserInfoList = TypeAdapter(List[UserInfo])
+
+USER_INFO_FIELDS = tuple(UserInfo.model_fields)
+
 class FineBase(BaseModel):
     user_lname: str = Field(..., max_length=100)
     user_fname: str = Field(..., max_length=100)
@@ -326,8 +383,7 @@ class FineCreate:
 class Fine(FineBase):
     id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class FineUpdate(BaseModel):
     fine_amount: Optional[Decimal] = None
@@ -335,8 +391,7 @@ class FineUpdate(BaseModel):
     fine_paid: Optional[bool] = None
     user_id: Optional[int] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class FineInfo(BaseModel):
     fine_id: int
@@ -347,6 +402,8 @@ class FineInfo(BaseModel):
     unreturned_books: List[str]
     paid: bool
 
+FineInfoList = TypeAdapter(List[FineInfo])
+
 # LoanHistory схемы
 class LoanHistoryBase(BaseModel):
     loan_id: int
@@ -359,5 +416,144 @@ class LoanHistory(LoanHistoryBase):
     loan: Optional[Loan]
     member: str
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# Журналы изменений (db_logs)
+class LogKind(str, Enum):
+    cards = "cards"
+    books = "books"
+    fines = "fines"
+    overall = "overall"
+
+class LogEntry(BaseModel):
+    log_id: int
+    entity_id: Optional[int] = None
+    table_name: Optional[str] = None
+    table_field: str
+    operation_type: str
+    prev_value: str
+    new_value: Optional[str] = None
+    change_time: datetime
+
+class LogPage(BaseModel):
+    items: List[LogEntry]
+    next_cursor: Optional[str] = None
+
+# Подсказки строки поиска
+class AutocompleteKind(str, Enum):
+    books = "books"
+    authors = "authors"
+    readers = "readers"
+
+class AutocompleteItem(BaseModel):
+    kind: AutocompleteKind
+    id: int
+    label: str
+
+# Инвентаризация: проверяемая зона и результат сверки
+class InventoryScope(str, Enum):
+    shelf = "shelf"
+    rack = "rack"
+    section = "section"
+
+class MisplacedCopy(BaseModel):
+    copy_id: int
+    shelf_id: int
+
+class InventoryReport(BaseModel):
+    scope: InventoryScope
+    scope_id: int
+    expected: int
+    scanned: int
+    found: int
+    missing: List[int]
+    misplaced: List[MisplacedCopy]
+    unexpected: List[int]
+    moved: int
+
+# Оценка штрафов для политик-кандидатов (/reports/fine-projection)
+class FinePolicy(BaseModel):
+    name: str = Field(..., max_length=100)
+    daily_rate: Decimal = Field(..., gt=0, description='Штраф за день просрочки')
+    grace_days: int = Field(0, ge=0, description='Дни просрочки без штрафа')
+    minimum: Decimal = Field(Decimal(100), ge=0, description='Минимальный штраф')
+    maximum: Optional[Decimal] = Field(None, gt=0, description='Максимальный штраф')
+
+class FineProjectionRequest(BaseModel):
+    policies: List[FinePolicy] = Field(..., min_length=1, max_length=20)
+    as_of: Optional[date] = None
+    buckets: List[Decimal] = Field([Decimal(100), Decimal(250), Decimal(500), Decimal(1000), Decimal(2500), Decimal(5000)], max_length=50)
+
+class FineBucket(BaseModel):
+    lower: Decimal
+    upper: Optional[Decimal]
+    loans: int
+
+class FinePolicyProjection(BaseModel):
+    name: str
+    loans: int
+    fined_loans: int
+    open_fined_loans: int
+    total: Decimal
+    open_total: Decimal
+    mean: Decimal
+    p50: Decimal
+    p90: Decimal
+    p99: Decimal
+    max: Decimal
+    histogram: List[FineBucket]
+
+class FineProjection(BaseModel):
+    as_of: date
+    policies: List[FinePolicyProjection]
+
+# Фоновые отчёты (/reports/jobs)
+class ReportKind(str, Enum):
+    circulation = "circulation"
+
+class ReportFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+
+class ReportJobCreate(BaseModel):
+    kind: ReportKind = ReportKind.circulation
+    format: ReportFormat = ReportFormat.csv
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+class ReportJobInfo(BaseModel):
+    job_id: str
+    kind: str
+    format: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+# Пакет подзапросов (/batch)
+class BatchMethod(str, Enum):
+    get = "GET"
+    post = "POST"
+    put = "PUT"
+    patch = "PATCH"
+    delete = "DELETE"
+
+class BatchSubRequest(BaseModel):
+    method: BatchMethod = BatchMethod.get
+    path: str = Field(..., pattern=r"^/", max_length=2000, description='Путь относительно /api, можно с параметрами')
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest] = Field(..., min_length=1, max_length=50)
+    transaction: bool = Field(False, description='Выполнить все подзапросы в одной транзакции')
+
+class BatchResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
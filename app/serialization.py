@@ -0,0 +1,68 @@
+import os
+from decimal import Decimal
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.schemas import ListFormat
+
+load_dotenv()
+
+# Строки из БД считаются доверенными и кодируются напрямую через orjson.
+# VALIDATE_RESPONSES=1 включает пакетную проверку списка через TypeAdapter (для отладки)
+VALIDATE_RESPONSES = os.getenv("VALIDATE_RESPONSES", "0") == "1"
+
+def _default(value):
+    # Decimal сериализуется строкой, как это делает Pydantic
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def columnar(rows, dictionary_fields=()):
+    # Поле -> массив значений. Повторяющиеся строки (жанры, расположение, статусы) заменяются
+    # индексами в словаре поля; у полей-списков кодируется каждый элемент
+    columns = {field: [row[field] for row in rows] for field in (rows[0] if rows else ())}
+    dictionaries = {}
+    for field in dictionary_fields:
+        if field not in columns:
+            continue
+        values = {}
+        columns[field] = [
+            [values.setdefault(item, len(values)) for item in value] if isinstance(value, list)
+            else None if value is None else values.setdefault(value, len(values))
+            for value in columns[field]
+        ]
+        dictionaries[field] = list(values)
+    return {"count": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+def parse_fields(value: str | None, allowed):
+    # fields=copy_id,status -> запрошенные поля в порядке ответа; None — все поля
+    if value is None:
+        return None
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = sorted(requested.difference(allowed))
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}, allowed: {list(allowed)}")
+    return tuple(field for field in allowed if field in requested)
+
+def list_response(rows, adapter, list_format=ListFormat.rows, dictionary_fields=()):
+    # adapter=None — строки неполные (fields=) и не проверяются моделью
+    if VALIDATE_RESPONSES and adapter is not None:
+        rows = adapter.validate_python(rows)
+        if list_format == ListFormat.rows:
+            return Response(adapter.dump_json(rows), media_type="application/json")
+        rows = adapter.dump_python(rows, mode="json")
+    if list_format == ListFormat.columnar:
+        return FastJSONResponse(columnar(rows, dictionary_fields))
+    return FastJSONResponse(rows)
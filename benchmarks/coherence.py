@@ -0,0 +1,61 @@
+import threading
+import time
+
+from benchmarks.run import percentile
+
+# Задержка согласованности кэшей: время от COMMIT записи в одном воркере до очистки кэша
+# в другом (уведомление LISTEN/NOTIFY). Второй воркер моделируется отдельной шиной
+# с собственным worker_id и соединением. Только PostgreSQL
+
+def measure_coherence(events: int, timeout: float = 5.0):
+    from app.database import SessionLocal, engine
+    from app.invalidation import InvalidationBus
+    from app.models import BookCopy
+
+    if engine.dialect.name != "postgresql":
+        return None
+
+    received = {}
+    condition = threading.Condition()
+    listener = InvalidationBus(engine, worker_id="benchmark-listener")
+
+    @listener.subscribe
+    def on_event(entity, entity_id):
+        with condition:
+            received[(entity, entity_id)] = time.perf_counter()
+            condition.notify_all()
+
+    listener.start()
+    try:
+        deadline = time.monotonic() + timeout
+        while not listener.connected and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with SessionLocal() as db:
+            copy_ids = [copy_id for (copy_id,) in db.query(BookCopy.copy_id).order_by(BookCopy.copy_id).limit(events)]
+
+        latencies = []
+        missed = 0
+        for i, copy_id in enumerate(copy_ids):
+            key = ("book_copies", copy_id)
+            with SessionLocal() as db:
+                db.get(BookCopy, copy_id).photo = f"coherence-{i}.jpg"
+                started = time.perf_counter()
+                db.commit()
+            with condition:
+                if condition.wait_for(lambda: key in received, timeout):
+                    latencies.append((received.pop(key) - started) * 1000)
+                else:
+                    missed += 1
+    finally:
+        listener.stop()
+
+    latencies.sort()
+    return {
+        "events": len(copy_ids),
+        "missed": missed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] if latencies else None,
+    }
@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+
+# Сравнение двух отчётов: python -m benchmarks.compare base.json head.json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps", "sql_statements_per_request", "response_bytes"]
+
+def change(base, head):
+    if base in (None, 0) or head is None:
+        return None
+    return (head - base) / base * 100
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--fail-threshold", type=float, default=None,
+                        help="Exit with code 1 if p95 latency grows by more than this percentage")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as base_file, open(args.head, encoding="utf-8") as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+
+    print(f"base: {base['meta'].get('commit')}  head: {head['meta'].get('commit')}")
+    if base["meta"].get("dataset") != head["meta"].get("dataset"):
+        print("warning: reports were produced with different datasets")
+
+    if base.get("startup") and head.get("startup"):
+        parts = []
+        for metric in ("import_ms", "lifespan_ms", "process_ms"):
+            delta = change(base["startup"].get(metric), head["startup"].get(metric))
+            parts.append(f"{metric}={head['startup'][metric]:.1f}" + (f" ({delta:+.1f}%)" if delta is not None else ""))
+        print(f"{'worker startup':40} " + "  ".join(parts))
+
+    if base.get("cache_coherence") and head.get("cache_coherence"):
+        parts = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            delta = change(base["cache_coherence"].get(metric), head["cache_coherence"].get(metric))
+            parts.append(f"{metric}={head['cache_coherence'][metric] or 0:.2f}" + (f" ({delta:+.1f}%)" if delta is not None else ""))
+        print(f"{'cache coherence':40} " + "  ".join(parts))
+
+    regressions = []
+    for name, head_stats in head["endpoints"].items():
+        base_stats = base["endpoints"].get(name)
+        if base_stats is None:
+            print(f"{name:40} new endpoint")
+            continue
+
+        parts = []
+        for metric in METRICS:
+            delta = change(base_stats.get(metric), head_stats.get(metric))
+            parts.append(f"{metric}={head_stats.get(metric) or 0:.2f}" + (f" ({delta:+.1f}%)" if delta is not None else ""))
+        print(f"{name:40} " + "  ".join(parts))
+
+        p95_delta = change(base_stats.get("p95_ms"), head_stats.get("p95_ms"))
+        if args.fail_threshold is not None and p95_delta is not None and p95_delta > args.fail_threshold:
+            regressions.append(name)
+
+    if regressions:
+        print("p95 regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
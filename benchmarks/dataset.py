@@ -0,0 +1,233 @@
+import random
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, insert, text
+
+from app import models
+
+BATCH_SIZE = 10000
+
+# Пароль сотрудника, под которым бенчмарк получает токен
+BENCH_USERNAME = "benchmark"
+BENCH_PASSWORD = "benchmark-password"
+
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков"]
+FIRST_NAMES = ["Александр", "Мария", "Дмитрий", "Анна", "Сергей", "Елена", "Андрей", "Ольга", "Иван", "Наталья"]
+MIDDLE_NAMES = ["Александрович", "Сергеевна", "Дмитриевич", "Ивановна", None]
+TITLE_WORDS = ["Война", "Мир", "Тихий", "Дон", "Мастер", "Море", "Звезда", "Город", "Сад", "Ночь", "Путь", "Время"]
+COPY_STATUSES = ["Доступна"] * 14 + ["На руках"] * 4 + ["Повреждена", "Утеряна"]
+READER_STATUSES = ["Активный"] * 9 + ["Неактивный"]
+
+@dataclass
+class DatasetSize:
+    copies: int = 10000
+    readers: int = 2000
+    loans: int = 50000
+    fines: int = 0
+    logs: int = 10000
+    seed: int = 42
+
+    def __post_init__(self):
+        self.fines = self.fines or max(1, self.readers // 5)
+        self.books = max(1, self.copies // 4)
+        self.authors = max(1, self.copies // 10)
+        self.genres = 30
+        self.categories = 10
+        self.publishers = 50
+        self.sections = 5
+        self.racks = self.sections * 10
+        self.shelves = max(self.racks, self.copies // 50)
+
+    def as_dict(self):
+        return asdict(self)
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _load(conn, model, rows):
+    for batch in _batches(rows):
+        conn.execute(insert(model), batch)
+
+def _title(rng):
+    return " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 3)))
+
+def generate(engine, size: DatasetSize, password_hash: str):
+    # Одинаковый seed даёт одинаковые данные, поэтому отчёты разных коммитов сравнимы
+    rng = random.Random(size.seed)
+    today = date(2026, 1, 1)
+
+    with engine.begin() as conn:
+        _load(conn, models.Section, (
+            {"section_id": i, "section_name": f"Секция {i}"} for i in range(1, size.sections + 1)
+        ))
+        _load(conn, models.Rack, (
+            {"rack_id": i, "rack_name": f"Стеллаж {i}", "section_id": (i - 1) % size.sections + 1}
+            for i in range(1, size.racks + 1)
+        ))
+        _load(conn, models.Shelf, (
+            {"shelf_id": i, "shelf_number": str((i - 1) // size.racks + 1), "rack_id": (i - 1) % size.racks + 1}
+            for i in range(1, size.shelves + 1)
+        ))
+        _load(conn, models.Genre, ({"genre_id": i, "genre_name": f"Жанр {i}"} for i in range(1, size.genres + 1)))
+        _load(conn, models.Category, (
+            {"category_id": i, "category_name": f"Категория {i}"} for i in range(1, size.categories + 1)
+        ))
+        _load(conn, models.Publisher, (
+            {"publisher_id": i, "publisher_name": f"Издательство {i}"} for i in range(1, size.publishers + 1)
+        ))
+        _load(conn, models.Author, (
+            {
+                "author_id": i,
+                "author_lname": f"{rng.choice(LAST_NAMES)}-{i}",
+                "author_fname": rng.choice(FIRST_NAMES),
+                "author_mname": rng.choice(MIDDLE_NAMES),
+                "birth_year": rng.randint(1800, 1990),
+                "death_year": None,
+            }
+            for i in range(1, size.authors + 1)
+        ))
+        _load(conn, models.Book, (
+            {
+                "book_id": i,
+                "book_name": f"{_title(rng)} {i}",
+                "publishing_year": rng.randint(1950, 2025),
+                "pages_number": rng.randint(50, 1200),
+                "category_id": rng.randint(1, size.categories),
+                "genre_id": rng.randint(1, size.genres),
+            }
+            for i in range(1, size.books + 1)
+        ))
+
+        def authors_books():
+            link_id = 0
+            for book_id in range(1, size.books + 1):
+                for author_id in rng.sample(range(1, size.authors + 1), min(size.authors, rng.randint(1, 2))):
+                    link_id += 1
+                    yield {"id": link_id, "author_id": author_id, "book_id": book_id}
+        _load(conn, models.AuthorBook, authors_books())
+
+        _load(conn, models.BookCopy, (
+            {
+                "copy_id": i,
+                "photo": None,
+                "status": rng.choice(COPY_STATUSES),
+                "book_id": (i - 1) % size.books + 1,
+                "publisher_id": rng.randint(1, size.publishers),
+            }
+            for i in range(1, size.copies + 1)
+        ))
+        _load(conn, models.BookLocation, (
+            {"id": i, "shelf_id": rng.randint(1, size.shelves), "copy_id": i} for i in range(1, size.copies + 1)
+        ))
+
+        def loans():
+            for i in range(1, size.loans + 1):
+                loan_date = today - timedelta(days=rng.randint(1, 3 * 365))
+                due_date = loan_date + timedelta(days=rng.choice([14, 30]))
+                returned = rng.random() < 0.95
+                yield {
+                    "loan_id": i,
+                    "loan_date": loan_date,
+                    "due_date": due_date,
+                    "return_date": loan_date + timedelta(days=rng.randint(1, 45)) if returned else None,
+                    "copy_id": rng.randint(1, size.copies),
+                }
+        _load(conn, models.Loan, loans())
+
+        _load(conn, models.UserCard, (
+            {
+                "user_id": i,
+                "user_lname": rng.choice(LAST_NAMES),
+                "user_fname": rng.choice(FIRST_NAMES),
+                "user_mname": rng.choice(MIDDLE_NAMES),
+                "user_passport_series": 1000 + i % 9000,
+                "user_passport_number": 100000 + i,
+                "user_email": f"reader{i}@example.com",
+                "status": rng.choice(READER_STATUSES),
+                "photo": None,
+                "registration_date": today - timedelta(days=rng.randint(1, 5 * 365)),
+                "loan_id": rng.randint(1, size.loans),
+            }
+            for i in range(1, size.readers + 1)
+        ))
+
+        fine_users = [rng.randint(1, size.readers) for _ in range(size.fines)]
+        _load(conn, models.Fine, (
+            {
+                "fine_id": i,
+                "fine_amount": rng.randint(100, 2000),
+                "fine_date": today - timedelta(days=rng.randint(1, 365)),
+                "fine_paid": rng.random() < 0.6,
+                "user_id": fine_users[i - 1],
+            }
+            for i in range(1, size.fines + 1)
+        ))
+        _load(conn, models.FineCard, (
+            {"id": i, "fine_id": i, "user_id": fine_users[i - 1]} for i in range(1, size.fines + 1)
+        ))
+
+        _load(conn, models.CardLog, (
+            {
+                "card_log_id": i,
+                "card_id": rng.randint(1, size.readers),
+                "table_field": "status",
+                "operation_type": "UPDATE",
+                "prev_value": "Активный",
+                "new_value": "Неактивный",
+                "change_time": datetime(2025, 1, 1) + timedelta(minutes=i * 7),
+            }
+            for i in range(1, size.logs + 1)
+        ))
+
+        # История выдач: смена user_cards.loan_id фиксируется в card_logs, как это делает триггер
+        def loan_history():
+            last_loan = {}
+            for i in range(1, size.loans + 1):
+                reader_id = rng.randint(1, size.readers)
+                yield {
+                    "card_log_id": size.logs + i,
+                    "card_id": reader_id,
+                    "table_field": "loan_id",
+                    "operation_type": "UPDATE",
+                    "prev_value": str(last_loan.get(reader_id, "")),
+                    "new_value": str(i),
+                    "change_time": datetime(2025, 1, 1) + timedelta(minutes=i * 3),
+                }
+                last_loan[reader_id] = i
+        _load(conn, models.CardLog, loan_history())
+
+        _load(conn, models.Employee, [{
+            "employee_id": 1,
+            "employee_lname": "Бенчмарк",
+            "employee_fname": "Сотрудник",
+            "employee_passport_series": 1000,
+            "employee_passport_number": 100000,
+        }])
+        _load(conn, models.EmployeeCredential, [{
+            "credential_id": 1,
+            "employee_id": 1,
+            "username": BENCH_USERNAME,
+            "password": password_hash,
+        }])
+
+        if conn.dialect.name == "postgresql":
+            _reset_sequences(conn)
+
+def _reset_sequences(conn):
+    # Данные вставлены с явными ID, последовательности нужно сдвинуть, чтобы POST-маршруты не получали дубликаты
+    for table in models.Base.metadata.sorted_tables:
+        column = list(table.primary_key.columns)[0]
+        if not isinstance(column.type, Integer):
+            continue
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.fullname}', '{column.name}'), "
+            f"COALESCE((SELECT max({column.name}) FROM {table.fullname}), 0) + 1, false)"
+        ))
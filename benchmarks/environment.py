@@ -0,0 +1,59 @@
+import os
+
+from sqlalchemy import CheckConstraint, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+
+SCHEMAS = ["library_schema", "db_logs", "employee_schema"]
+
+# Проверочные ограничения моделей ссылаются на функции author_now()/book_now(),
+# которых нет в чистой базе, поэтому в тестовой схеме они не создаются
+@compiles(CheckConstraint)
+def _skip_check_constraint(element, compiler, **kw):
+    return None
+
+def configure(database_url: str):
+    # Вызывать до импорта модулей app: app.database читает URL при импорте
+    os.environ["SQLALCHEMY_DATABASE_URI"] = database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    os.environ.setdefault("ACCESS_LOG", "0")
+    # Все запросы бенчмарка идут с одним токеном; ограничение частоты исказило бы замеры
+    os.environ.setdefault("RATE_LIMIT_RATE", "0")
+
+    from app.database import engine, replicas
+    from app.models import Base
+
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        for target in [engine, *replicas.engines]:
+            attach_schemas(target)
+
+        # SQLite не поддерживает автоинкремент в составных ключах (секционированные журналы)
+        for table in Base.metadata.tables.values():
+            if len(table.primary_key.columns) > 1:
+                for column in table.primary_key.columns:
+                    column.autoincrement = False
+
+    return engine
+
+def attach_schemas(engine):
+    if not engine.url.database:
+        raise ValueError("SQLite benchmarks need a file database")
+
+    # Схемы PostgreSQL эмулируются подключёнными файлами SQLite
+    base, _ = os.path.splitext(engine.url.database)
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        for schema in SCHEMAS:
+            dbapi_connection.execute(f"ATTACH DATABASE '{base}_{schema}.db' AS {schema}")
+
+def create_schema(engine):
+    from app import manage
+
+    manage.create_schema(engine)
+
+def drop_schema(engine):
+    from app.models import Base
+
+    Base.metadata.drop_all(bind=engine)
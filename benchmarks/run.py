@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from benchmarks.environment import configure, create_schema, drop_schema
+from benchmarks.startup import measure_startup
+
+# Запуск: python -m benchmarks.run --database-url sqlite:///bench/library.db --generate
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def build_scenarios(size, iterations, list_iterations):
+    from benchmarks.dataset import BENCH_USERNAME, BENCH_PASSWORD
+
+    # Маршруты с записью используют разные ID на каждой итерации, чтобы не мешать друг другу
+    def tail(total, i):
+        return max(1, total - i)
+
+    return [
+        ("POST /token", list_iterations, lambda i: (
+            "POST", "/token", {"data": {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}}
+        )),
+        ("GET /api/books", list_iterations, lambda i: ("GET", "/api/books", {})),
+        ("GET /api/books?format=columnar", list_iterations, lambda i: (
+            "GET", "/api/books", {"params": {"format": "columnar"}}
+        )),
+        ("GET /api/books?fields=copy_id,status", list_iterations, lambda i: (
+            "GET", "/api/books", {"params": {"fields": "copy_id,status"}}
+        )),
+        ("GET /api/books?fields=copy_id,book,author", list_iterations, lambda i: (
+            "GET", "/api/books", {"params": {"fields": "copy_id,book,author"}}
+        )),
+        ("GET /api/books/popular", iterations, lambda i: (
+            "GET", "/api/books/popular", {"params": {"period": ["week", "month", "all"][i % 3], "genre_id": i % 5 + 1}}
+        )),
+        ("GET /api/autocomplete", iterations, lambda i: (
+            "GET", "/api/autocomplete", {"params": {"q": ["бен", "вас", "ив", "пет", "ал"][i % 5]}}
+        )),
+        ("GET /api/books/{copy_id}", iterations, lambda i: ("GET", f"/api/books/{i % size.copies + 1}", {})),
+        ("GET /api/books/{copy_id}?fields=copy_id,status", iterations, lambda i: (
+            "GET", f"/api/books/{i % size.copies + 1}", {"params": {"fields": "copy_id,status"}}
+        )),
+        ("POST /api/books/new", iterations, lambda i: ("POST", "/api/books/new", {"json": {
+            "book_name": f"Бенчмарк {i}",
+            "publishing_year": 2020,
+            "pages_number": 300,
+            "category_name": "Категория 1",
+            "genre_name": "Жанр 1",
+            "author_lname": "Бенчмарков",
+            "author_fname": "Автор",
+            "birth_year": 1970,
+        }})),
+        ("POST /api/books/new/copy", iterations, lambda i: ("POST", "/api/books/new/copy", {"json": {
+            "book_name": f"Бенчмарк {i}",
+            "publisher_name": "Издательство 1",
+            "shelf_id": 1,
+        }})),
+        ("PATCH /api/books/{copy_id}", iterations, lambda i: (
+            "PATCH", f"/api/books/{i % size.copies + 1}", {"json": {"status": "Доступна"}}
+        )),
+        ("DELETE /api/books/{copy_id}", iterations, lambda i: ("DELETE", f"/api/books/{tail(size.copies, i)}", {})),
+        ("GET /api/readers", list_iterations, lambda i: ("GET", "/api/readers", {})),
+        ("GET /api/readers?fields=user_id,fines", list_iterations, lambda i: (
+            "GET", "/api/readers", {"params": {"fields": "user_id,fines"}}
+        )),
+        ("GET /api/readers?fields=user_id,user_name", list_iterations, lambda i: (
+            "GET", "/api/readers", {"params": {"fields": "user_id,user_name"}}
+        )),
+        ("GET /api/readers/{reader_id}", iterations, lambda i: ("GET", f"/api/readers/{i % size.readers + 1}", {})),
+        ("POST /api/readers/new", iterations, lambda i: ("POST", "/api/readers/new", {"json": {
+            "user_lname": "Читатель",
+            "user_fname": "Новый",
+            "user_passport_series": 9999,
+            "user_passport_number": 900000 + i,
+            "user_email": f"new-reader{i}@example.com",
+            "photo": "",
+        }})),
+        ("PATCH /api/readers/{reader_id}", iterations, lambda i: (
+            "PATCH", f"/api/readers/{i % size.readers + 1}", {"json": {"status": "Активный"}}
+        )),
+        ("DELETE /api/readers/{reader_id}", iterations, lambda i: (
+            "DELETE", f"/api/readers/{tail(size.readers, i)}", {}
+        )),
+        ("GET /api/fines", list_iterations, lambda i: ("GET", "/api/fines", {})),
+        ("GET /api/fines/{fine_id}", iterations, lambda i: ("GET", f"/api/fines/{i % size.fines + 1}", {})),
+        ("PATCH /api/fines/{fine_id}", iterations, lambda i: (
+            "PATCH", f"/api/fines/{i % size.fines + 1}", {"json": {"fine_paid": True}}
+        )),
+        ("DELETE /api/fines/{fine_id}", iterations, lambda i: ("DELETE", f"/api/fines/{tail(size.fines, i)}", {})),
+        ("POST /api/loans/new", iterations, lambda i: ("POST", "/api/loans/new", {"json": {
+            "due_date": "2030-01-01",
+            "book_name": f"Бенчмарк {i}",
+            "user_id": i % size.readers + 1,
+        }})),
+        ("GET /api/logs/{kind}", iterations, lambda i: ("GET", "/api/logs/cards", {"params": {"limit": 100}})),
+    ]
+
+async def run_scenario(client, counter, headers, requests, build, concurrency):
+    latencies = []
+    response_bytes = 0
+    status_codes = {}
+    queue = list(range(requests))
+    statements_before = counter.count
+
+    async def worker():
+        nonlocal response_bytes
+        while queue:
+            method, path, kwargs = build(queue.pop(0))
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response_bytes += response.num_bytes_downloaded
+            status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "status_codes": status_codes,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+        "throughput_rps": requests / elapsed if elapsed else None,
+        "sql_statements_per_request": (counter.count - statements_before) / requests if requests else None,
+        # Размер тела ответа после сжатия (клиент отправляет Accept-Encoding)
+        "response_bytes": response_bytes / requests if requests else None,
+    }
+
+async def run(args, engine, size):
+    import httpx
+
+    from app.main import app
+
+    counter = StatementCounter(engine)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    endpoints = {}
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        from benchmarks.dataset import BENCH_USERNAME, BENCH_PASSWORD
+
+        response = await client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for name, requests, build in build_scenarios(size, args.iterations, args.list_iterations):
+            if args.only and not any(part in name for part in args.only):
+                continue
+            endpoints[name] = await run_scenario(client, counter, headers, requests, build, args.concurrency)
+            print(f"{name:40} p50={endpoints[name]['p50_ms']:.2f}ms p95={endpoints[name]['p95_ms']:.2f}ms "
+                  f"sql={endpoints[name]['sql_statements_per_request']:.1f} {endpoints[name]['status_codes']}")
+
+    return endpoints
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--generate", action="store_true", help="Recreate the schema and the synthetic dataset")
+    parser.add_argument("--copies", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=2000)
+    parser.add_argument("--loans", type=int, default=50000)
+    parser.add_argument("--fines", type=int, default=0)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--list-iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--startup-runs", type=int, default=5, help="Worker start measurements (0 to skip)")
+    parser.add_argument("--coherence-events", type=int, default=100,
+                        help="Writes used to measure cache invalidation latency (PostgreSQL only, 0 to skip)")
+    parser.add_argument("--only", nargs="*", help="Run only endpoints whose name contains one of these strings")
+    parser.add_argument("--output", default="benchmark-report.json")
+    args = parser.parse_args(argv)
+
+    engine = configure(args.database_url)
+
+    from benchmarks.dataset import DatasetSize, BENCH_PASSWORD, generate
+
+    size = DatasetSize(
+        copies=args.copies, readers=args.readers, loans=args.loans,
+        fines=args.fines, logs=args.logs, seed=args.seed,
+    )
+
+    if args.generate:
+        from app.auth import get_password_hash
+
+        started = time.perf_counter()
+        drop_schema(engine)
+        create_schema(engine)
+        generate(engine, size, get_password_hash(BENCH_PASSWORD))
+
+        from app import popularity, recommendations
+        from app.database import SessionLocal
+
+        with SessionLocal() as db:
+            recommendations.rebuild(db)
+            popularity.backfill(db)
+        print(f"Dataset generated in {time.perf_counter() - started:.1f}s")
+
+    startup = measure_startup(args.database_url, args.startup_runs) if args.startup_runs else None
+    if startup:
+        print(f"Worker startup: import={startup['import_ms']:.0f}ms lifespan={startup['lifespan_ms']:.0f}ms "
+              f"process={startup['process_ms']:.0f}ms")
+
+    endpoints = asyncio.run(run(args, engine, size))
+
+    coherence = None
+    if args.coherence_events:
+        from benchmarks.coherence import measure_coherence
+
+        coherence = measure_coherence(args.coherence_events)
+        if coherence:
+            print(f"Cache coherence: p50={coherence['p50_ms']:.2f}ms p95={coherence['p95_ms']:.2f}ms "
+                  f"missed={coherence['missed']}/{coherence['events']}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "dataset": size.as_dict(),
+            "iterations": args.iterations,
+            "list_iterations": args.list_iterations,
+            "concurrency": args.concurrency,
+        },
+        "startup": startup,
+        "cache_coherence": coherence,
+        "endpoints": endpoints,
+    }
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+    print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+from benchmarks.environment import configure
+
+# Скорость сериализации списков без HTTP: python -m benchmarks.serialization --database-url sqlite:///bench/library.db
+# Сравниваются три пути: модель Pydantic на каждую строку, пакетный TypeAdapter и orjson по словарям
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    engine = configure(args.database_url)
+
+    from sqlalchemy.orm import Session
+
+    from app import crud, schemas
+    from app.serialization import dumps
+
+    with Session(engine) as db:
+        datasets = [
+            ("books", crud.get_book_copy_rows(db), schemas.BookCopyInfo, schemas.BookCopyInfoList),
+            ("readers", crud.get_reader_rows(db), schemas.UserInfo, schemas.UserInfoList),
+            ("fines", crud.get_fine_rows(db, limit=None), schemas.FineInfo, schemas.FineInfoList),
+        ]
+
+    for name, rows, model, adapter in datasets:
+        if not rows:
+            print(f"{name:10} no rows")
+            continue
+        paths = {
+            "pydantic_per_row": lambda: dumps([model(**row).model_dump(mode="json") for row in rows]),
+            "type_adapter": lambda: adapter.dump_json(adapter.validate_python(rows)),
+            "orjson": lambda: dumps(rows),
+        }
+        results = {path: len(rows) / measure(function, args.repeat) for path, function in paths.items()}
+        print(f"{name:10} rows={len(rows):<7} " + "  ".join(f"{path}={rate:,.0f} rows/s" for path, rate in results.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# Время запуска воркера: импорт app.main и выполнение lifespan в отдельном процессе
+
+def measure_child(database_url: str):
+    started = time.perf_counter()
+
+    from benchmarks.environment import configure
+
+    configure(database_url)
+
+    import asyncio
+
+    from app.main import app
+
+    imported = time.perf_counter()
+
+    async def start():
+        async with app.router.lifespan_context(app):
+            return time.perf_counter()
+
+    ready = asyncio.run(start())
+    print(json.dumps({"import_ms": (imported - started) * 1000, "lifespan_ms": (ready - imported) * 1000}))
+
+def measure_startup(database_url: str, runs: int = 5):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--database-url", database_url],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+
+    return {
+        key: sorted(sample[key] for sample in samples)[len(samples) // 2]
+        for key in ("import_ms", "lifespan_ms", "process_ms")
+    } | {"runs": runs}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--database-url", required=True)
+    measure_child(parser.parse_args().database_url)